@@ -0,0 +1,243 @@
+"""Endgame bitbases for a king and one piece against a bare king.
+
+A bitbase holds one bit per position, set when the side with the piece
+wins with best play. With a single piece the bare king can never win, so
+a clear bit is a draw (or a position that cannot arise). Positions are
+indexed by the side to move, the strong king, the weak king and the
+piece, with the strong side as white:
+
+    turn << 18 | strong_king << 12 | weak_king << 6 | square
+
+turn is 0 with the strong side to move and 1 with the weak side to move.
+That is 2^19 bits, a 64KB file per piece type. Positions with black as
+the strong side are flipped top to bottom and the colors swapped before
+probing.
+
+The tables are solved offline by retrograde analysis, working back from
+the mates, and written out with
+
+    python bitbase.py [directory]
+
+They are memory mapped when probed, so loading them costs nothing."""
+# stdlib imports
+import mmap
+import os
+import sys
+from time import time
+
+# local imports
+from bitboard import (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, bits, popcount,
+                      KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS,
+                      rook_attacks, bishop_attacks, queen_attacks)
+
+POSITIONS = 1 << 19
+WEAK_TO_MOVE = 1 << 18
+
+# The tables, by piece type, and their file names. A pawn promotes, so
+# its table is solved from the queen and rook tables.
+BITBASE_NAMES = {QUEEN: "kqk.bitbase", ROOK: "krk.bitbase",
+                 PAWN: "kpk.bitbase"}
+PROMOTION_KINDS = (QUEEN, ROOK)
+
+
+def bitbase_index(turn, strong_king, weak_king, square):
+    """Returns the index of a position, the strong side as white."""
+    return turn << 18 | strong_king << 12 | weak_king << 6 | square
+
+
+def _attack_function(kind):
+    """Returns a function of (square, occupancy) giving the squares a
+    white piece of the kind attacks."""
+    if kind == PAWN:
+        return lambda square, occupancy: PAWN_ATTACKS[0][square]
+    if kind == KNIGHT:
+        return lambda square, occupancy: KNIGHT_ATTACKS[square]
+    return {BISHOP: bishop_attacks, ROOK: rook_attacks,
+            QUEEN: queen_attacks}[kind]
+
+
+# ------------ Generation -------------
+
+
+def generate(kind, promotions=None):
+    """Solves king and piece against king by retrograde analysis and
+    returns the packed bitbase. A pawn's table needs promotions, the
+    solved tables of the pieces in PROMOTION_KINDS by piece type.
+
+    Every position with the weak side to move starts with a count of its
+    king moves. Mates are wins. Each new win is taken back a move: a
+    position the strong side could have moved from is won, and a
+    position the weak king could have come from loses one of its moves,
+    and is won once it has none left. A weak king that can take the
+    piece always has a draw."""
+    attacks = _attack_function(kind)
+    won = bytearray(POSITIONS)
+    moves_left = [0] * WEAK_TO_MOVE
+    found = []
+    squares = range(8, 56) if kind == PAWN else range(64)
+
+    def mark(position):
+        if not won[position]:
+            won[position] = 1
+            found.append(position)
+
+    for strong_king in range(64):
+        for weak_king in range(64):
+            if (weak_king == strong_king or
+                    KING_ATTACKS[strong_king] >> weak_king & 1):
+                continue
+            for square in squares:
+                if square == strong_king or square == weak_king:
+                    continue
+                occupancy = (1 << strong_king | 1 << weak_king |
+                             1 << square)
+                position = strong_king << 12 | weak_king << 6 | square
+                guarded = (KING_ATTACKS[strong_king] |
+                           attacks(square, occupancy ^ 1 << weak_king))
+                escapes = KING_ATTACKS[weak_king] & ~guarded
+                if escapes >> square & 1:
+                    moves_left[position] = -1
+                elif escapes:
+                    moves_left[position] = popcount(escapes)
+                elif guarded >> weak_king & 1:
+                    mark(WEAK_TO_MOVE | position)
+                # With the strong side to move, a pawn about to promote
+                # wins if the new piece does.
+                if (kind == PAWN and square < 16 and
+                        not occupancy >> (square - 8) & 1 and
+                        not attacks(square, occupancy) >>
+                        weak_king & 1):
+                    promoted = bitbase_index(1, strong_king, weak_king,
+                                             square - 8)
+                    for table in promotions.values():
+                        if table[promoted >> 3] >> (promoted & 7) & 1:
+                            mark(position)
+                            break
+
+    while found:
+        position = found.pop()
+        strong_king = position >> 12 & 63
+        weak_king = position >> 6 & 63
+        square = position & 63
+        occupancy = 1 << strong_king | 1 << weak_king | 1 << square
+        if position & WEAK_TO_MOVE:
+            # The strong side moved into a win. The position before must
+            # not have had the weak king in check.
+            for origin in bits(KING_ATTACKS[strong_king] & ~occupancy &
+                               ~KING_ATTACKS[weak_king]):
+                before = occupancy ^ 1 << strong_king ^ 1 << origin
+                if not attacks(square, before) >> weak_king & 1:
+                    mark(origin << 12 | weak_king << 6 | square)
+            if kind == PAWN:
+                origins = 0
+                if square < 48 and not occupancy >> (square + 8) & 1:
+                    origins = 1 << (square + 8)
+                    if (square >> 3 == 4 and
+                            not occupancy >> (square + 16) & 1):
+                        origins |= 1 << (square + 16)
+            else:
+                origins = attacks(square, occupancy) & ~occupancy
+            for origin in bits(origins):
+                before = occupancy ^ 1 << square ^ 1 << origin
+                if not attacks(origin, before) >> weak_king & 1:
+                    mark(strong_king << 12 | weak_king << 6 | origin)
+        else:
+            # The weak king moved into a loss.
+            for origin in bits(KING_ATTACKS[weak_king] & ~occupancy &
+                               ~KING_ATTACKS[strong_king]):
+                before = strong_king << 12 | origin << 6 | square
+                if moves_left[before] > 0:
+                    moves_left[before] -= 1
+                    if not moves_left[before]:
+                        mark(WEAK_TO_MOVE | before)
+
+    packed = bytearray(POSITIONS >> 3)
+    for position in range(POSITIONS):
+        if won[position]:
+            packed[position >> 3] |= 1 << (position & 7)
+    return packed
+
+
+def generate_all(directory="."):
+    """Solves every table in BITBASE_NAMES and writes them to the
+    directory, printing how long each took."""
+    tables = {}
+    for kind in (QUEEN, ROOK, PAWN):
+        start = time()
+        tables[kind] = generate(kind, {promoted: tables[promoted]
+                                       for promoted in PROMOTION_KINDS
+                                       if promoted in tables})
+        with open(os.path.join(directory, BITBASE_NAMES[kind]),
+                  "wb") as table_file:
+            table_file.write(tables[kind])
+        print(BITBASE_NAMES[kind] + ": " + str(time() - start))
+    return tables
+
+
+# ------------ Probing -------------
+
+
+class Bitbases:
+    """The bitbases found in a directory, memory mapped. Use it as a
+    context manager, or close it when done."""
+    def __init__(self, directory="."):
+        self.tables = {}
+        for kind, name in BITBASE_NAMES.items():
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                with open(path, "rb") as table_file:
+                    self.tables[kind] = mmap.mmap(table_file.fileno(), 0,
+                                                  access=mmap.ACCESS_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Unmaps the tables."""
+        for table in self.tables.values():
+            table.close()
+        self.tables = {}
+
+    def probe(self, board):
+        """Returns 1 if the side to move wins, -1 if it loses and 0 if the
+        position is a draw. Returns None for positions not covered: more
+        than three men, a king missing or a table that was not found. A
+        lone minor piece cannot mate, so those count as draws without a
+        table."""
+        if None in board.king_squares:
+            return None
+        men = popcount(board.occupancy)
+        if men == 2:
+            return 0
+        if men != 3:
+            return None
+        for strong in range(2):
+            bitboards = board.bitboards[strong]
+            for kind in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN):
+                if bitboards[kind]:
+                    break
+            else:
+                continue
+            break
+        if kind in (KNIGHT, BISHOP):
+            return 0
+        table = self.tables.get(kind)
+        if table is None:
+            return None
+        # Black as the strong side is flipped to white.
+        flip = 56 if strong else 0
+        position = bitbase_index(
+            board.turn ^ strong, board.king_squares[strong] ^ flip,
+            board.king_squares[1 - strong] ^ flip,
+            (bitboards[kind].bit_length() - 1) ^ flip)
+        if not table[position >> 3] >> (position & 7) & 1:
+            return 0
+        return 1 if board.turn == strong else -1
+
+
+if __name__ == "__main__":
+    # python bitbase.py [directory]
+    generate_all(sys.argv[1] if len(sys.argv) > 1 else ".")
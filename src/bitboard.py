@@ -0,0 +1,157 @@
+"""Bitboard helpers used by the engine. A bitboard is a 64 bit integer
+with one bit per square, numbered the same way as the board array:
+a8 is bit 0, h8 is bit 7 and h1 is bit 63."""
+
+# ------------ Constants -------------
+
+# Piece types, used to index a color's bitboards.
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+
+FULL = 0xFFFFFFFFFFFFFFFF
+
+# ------------ Utility Functions -------------
+
+
+def lsb(bitboard):
+    """Returns the index of the lowest set bit of a non empty bitboard."""
+    return (bitboard & -bitboard).bit_length() - 1
+
+
+def bits(bitboard):
+    """Yields the square index of every set bit, lowest first."""
+    while bitboard:
+        low = bitboard & -bitboard
+        yield low.bit_length() - 1
+        bitboard ^= low
+
+
+if hasattr(int, "bit_count"):
+    # Python 3.10 and up count bits natively, several times faster.
+    popcount = int.bit_count
+else:
+    def popcount(bitboard):
+        """Returns the number of set bits in the bitboard."""
+        return bin(bitboard).count("1")
+
+
+# ------------ Attack Tables -------------
+# Built once at import, indexed by square.
+
+
+def _leaper_attacks(offsets):
+    """Builds the attack table of a piece that jumps by the (dx, dy)
+    offsets. Squares off the board are simply left out."""
+    table = []
+    for square in range(64):
+        x_coord, y_coord = square & 7, square >> 3
+        attacks = 0
+        for d_x, d_y in offsets:
+            if 0 <= x_coord + d_x < 8 and 0 <= y_coord + d_y < 8:
+                attacks |= 1 << (x_coord + d_x + (y_coord + d_y) * 8)
+        table.append(attacks)
+    return table
+
+
+KNIGHT_ATTACKS = _leaper_attacks([(1, 2), (-1, 2), (2, 1), (2, -1),
+                                  (1, -2), (-1, -2), (-2, 1), (-2, -1)])
+KING_ATTACKS = _leaper_attacks([(0, 1), (1, 1), (1, 0), (1, -1),
+                                (0, -1), (-1, -1), (-1, 0), (-1, 1)])
+
+# Pawn capture squares, indexed by color then square. White pawns move
+# towards rank 8, which is the top of the board (lower square numbers).
+PAWN_ATTACKS = [_leaper_attacks([(1, -1), (-1, -1)]),
+                _leaper_attacks([(1, 1), (-1, 1)])]
+
+# Sliding pieces look their attacks up by the occupancy of the squares that
+# can block them. Every blocker subset of every square is enumerated once,
+# and the table maps the masked occupancy straight to the attack bitboard,
+# so a ray query is a mask and a dict lookup. Edge squares never block
+# anything beyond themselves, so they are left out of the masks.
+
+ROOK_DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+BISHOP_DIRECTIONS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+
+def _ray_attacks(square, directions, occupancy):
+    """Walks each direction from the square until the edge or the first
+    occupied square (which is included)."""
+    attacks = 0
+    for d_x, d_y in directions:
+        x_coord, y_coord = (square & 7) + d_x, (square >> 3) + d_y
+        while 0 <= x_coord < 8 and 0 <= y_coord < 8:
+            bit = 1 << (x_coord + y_coord * 8)
+            attacks |= bit
+            if occupancy & bit:
+                break
+            x_coord, y_coord = x_coord + d_x, y_coord + d_y
+    return attacks
+
+
+def _blocker_mask(square, directions):
+    """Returns the squares whose occupancy can change the attacks from
+    the square: every ray square except the last one on the edge."""
+    mask = 0
+    for d_x, d_y in directions:
+        x_coord, y_coord = (square & 7) + d_x, (square >> 3) + d_y
+        while (0 <= x_coord + d_x < 8 and 0 <= y_coord + d_y < 8):
+            mask |= 1 << (x_coord + y_coord * 8)
+            x_coord, y_coord = x_coord + d_x, y_coord + d_y
+    return mask
+
+
+def _sliding_tables(directions):
+    """Returns the blocker masks and occupancy indexed attack tables."""
+    masks = []
+    tables = []
+    for square in range(64):
+        mask = _blocker_mask(square, directions)
+        table = {}
+        # Carry-rippler trick, enumerates every subset of the mask.
+        subset = 0
+        while True:
+            table[subset] = _ray_attacks(square, directions, subset)
+            subset = (subset - mask) & mask
+            if not subset:
+                break
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+
+ROOK_MASKS, ROOK_TABLES = _sliding_tables(ROOK_DIRECTIONS)
+BISHOP_MASKS, BISHOP_TABLES = _sliding_tables(BISHOP_DIRECTIONS)
+
+
+def rook_attacks(square, occupancy):
+    """Returns the squares a rook on the square attacks."""
+    return ROOK_TABLES[square][occupancy & ROOK_MASKS[square]]
+
+
+def bishop_attacks(square, occupancy):
+    """Returns the squares a bishop on the square attacks."""
+    return BISHOP_TABLES[square][occupancy & BISHOP_MASKS[square]]
+
+
+def queen_attacks(square, occupancy):
+    """Returns the squares a queen on the square attacks."""
+    return (ROOK_TABLES[square][occupancy & ROOK_MASKS[square]] |
+            BISHOP_TABLES[square][occupancy & BISHOP_MASKS[square]])
+
+
+def _line_tables():
+    """Builds BETWEEN and LINE. For two squares on a shared rank, file or
+    diagonal, BETWEEN holds the squares strictly between them and LINE
+    the whole line through both. Unaligned pairs are left empty."""
+    between = [[0] * 64 for square in range(64)]
+    line = [[0] * 64 for square in range(64)]
+    for first in range(64):
+        for attacks in (rook_attacks, bishop_attacks):
+            for second in bits(attacks(first, 0)):
+                between[first][second] = (attacks(first, 1 << second) &
+                                          attacks(second, 1 << first))
+                line[first][second] = (attacks(first, 0) & attacks(second, 0) |
+                                       1 << first | 1 << second)
+    return between, line
+
+
+BETWEEN, LINE = _line_tables()
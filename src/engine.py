@@ -5,6 +5,14 @@ from enum import Enum
 from copy import deepcopy
 import random
 
+# local imports
+from bitboard import (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, FULL, bits,
+                      lsb, popcount, KNIGHT_ATTACKS, KING_ATTACKS,
+                      PAWN_ATTACKS, BETWEEN, LINE, rook_attacks,
+                      bishop_attacks, queen_attacks)
+from zobrist import PIECE_KEYS, SIDE_KEY, CASTLING_KEYS, EN_PASSANT_KEYS
+from evaluation import MG_TABLES, EG_TABLES, PHASE_WEIGHTS
+
 # ------------ Utility Functions -------------
 
 
@@ -25,21 +33,104 @@ def xy_to_num(xy_coords):
     return xy_coords[0] + xy_coords[1]*8
 
 
+def num_to_xy(square):
+    """Converts an array index to an xy coordinate list."""
+    return [square & 7, square >> 3]
+
+
+# ------------ Moves -------------
+# Moves are packed into ints:
+#   bits 0-5    from square
+#   bits 6-11   to square
+#   bits 12-14  piece type promoted to, 0 (a pawn) if not a promotion
+#   bits 15-18  flags below
+# The from square, to square and promotion together (move & 0x7FFF)
+# identify a move in a position; the flags save looking at the board.
+
+CAPTURE = 1 << 15
+CASTLE = 1 << 16
+EN_PASSANT = 1 << 17
+DOUBLE_PUSH = 1 << 18
+
+# Letters used for piece types, indexed by type.
+PIECE_LETTERS = "PNBRQK"
+# Promotion choices, in the order they are generated.
+PROMOTION_KINDS = (QUEEN, KNIGHT, ROOK, BISHOP)
+# The king and rook home squares, moves touching them can change the
+# castling rights.
+CASTLING_SQUARES = 1 << 0 | 1 << 4 | 1 << 7 | 1 << 56 | 1 << 60 | 1 << 63
+# Every square not on the a and h files.
+NOT_A_FILE = 0xFEFEFEFEFEFEFEFE
+NOT_H_FILE = 0x7F7F7F7F7F7F7F7F
+# Ranks 8, 6, 3 and 1, as bitboards.
+RANK_8 = 0xFF
+RANK_6 = 0xFF << 16
+RANK_3 = 0xFF << 40
+RANK_1 = 0xFF << 56
+
+
+def move_position(move):
+    """Returns the xy position a packed move goes to. Promotions put the
+    promotion letter in place of y, e.g. [3, "Q"]."""
+    to_square = move >> 6 & 63
+    if move >> 12 & 7:
+        return [to_square & 7, PIECE_LETTERS[move >> 12 & 7]]
+    return [to_square & 7, to_square >> 3]
+
+
+def square_name(square):
+    """Returns the algebraic name of a square, e.g. 60 is "e1"."""
+    return "abcdefgh"[square & 7] + str(8 - (square >> 3))
+
+
+def move_name(move):
+    """Returns a packed move in long algebraic (UCI) form, e.g. "e2e4" or
+    "b7b8q" for a promotion."""
+    name = square_name(move & 63) + square_name(move >> 6 & 63)
+    if move >> 12 & 7:
+        name += PIECE_LETTERS[move >> 12 & 7].lower()
+    return name
+
+
 # ------------ Pieces -------------
 # All pieces have at least position and owner (a Player) attributes.
+# Pieces use __slots__, as a board holds up to 32 of them; the color (a
+# Color value) and square are kept as ints and position is worked out
+# from the square.
 
 class Piece():
-    """Base class for all peices."""
+    """Base class for all peices. Subclasses set kind to their piece type,
+    which indexes the board's bitboards."""
+    __slots__ = ("owner", "color", "square", "first_move")
+    kind = None
 
     def __init__(self, owner, position):
         self.owner = owner
+        self.color = owner.color.value
         self.position = position
         self.first_move = True
 
+    @property
+    def position(self):
+        """The piece's position in xy format."""
+        return [self.square & 7, self.square >> 3]
+
+    @position.setter
+    def position(self, position):
+        self.square = xy_to_num(position)
+
     def get_position(self):
         """Returns this piece's position"""
         return self.position
 
+    def get_legal_moves(self, board, consider_checks):
+        """Returns a list of all the legal moves for this piece on this
+        board. Without consider_checks, moves that would leave the owner
+        in check are kept (and castling is never returned)."""
+        moves = board.generate_moves(self.color, 1 << self.square,
+                                     consider_checks)
+        return [move_position(move) for move in moves]
+
     def filter_checks(self, moves, board):
         """ Arguments:
             piece - a piece, has owner and position
@@ -48,115 +139,17 @@ class Piece():
             Returns a list without moves that would lead to check."""
         final = []
         for move in moves:
-            new_board = Board(board.board, board.en_passant)
-            new_piece = new_board.get_piece_at_position(self.position)
-            new_board.make_move(new_piece, move)
-            if not new_board.is_in_check(new_piece.owner):
+            board.make_move(self, move)
+            if not board.is_in_check(self.owner):
                 final += move,
+            board.unmake_move()
         return final
 
 
 class Pawn(Piece):
     """The pawn piece. Has special 'first_move' attribute."""
-
-    def get_legal_moves(self, board, consider_checks):
-        """Returns a list of all the legal moves for this piece
-        on this board."""
-        moves = []
-        # If first move, can move two spaces ahead, if both spaces empty
-        if self.owner.color == Color.B:
-            if (self.first_move and
-                    board.check_if_empty([self.position[0],
-                                          self.position[1] + 1]) and
-                    board.check_if_empty([self.position[0],
-                                          self.position[1] + 2])):
-                moves += [self.position[0], self.position[1] + 2],
-            # Can move one space ahead if empty
-            if board.check_if_empty([self.position[0], self.position[1] + 1]):
-                # end of board, promotion
-                if self.position[1] + 1 == 7:
-                    moves += [self.position[0], "Q"],
-                    moves += [self.position[0], "N"],
-                    moves += [self.position[0], "R"],
-                    moves += [self.position[0], "B"],
-                else:
-                    moves += [self.position[0], self.position[1] + 1],
-            # Can capture to the forward diagonals
-            if board.check_if_opponent([self.position[0] + 1,
-                                        self.position[1] + 1], self.owner):
-                if self.position[1] + 1 == 7:
-                    moves += [self.position[0] + 1, "Q"],
-                    moves += [self.position[0] + 1, "N"],
-                    moves += [self.position[0] + 1, "R"],
-                    moves += [self.position[0] + 1, "B"],
-                else:
-                    moves += [self.position[0] + 1, self.position[1] + 1],
-            if (board.check_if_opponent([self.position[0] - 1,
-                                         self.position[1] + 1], self.owner)):
-                if self.position[1] + 1 == 7:
-                    moves += [self.position[0] - 1, "Q"],
-                    moves += [self.position[0] - 1, "N"],
-                    moves += [self.position[0] - 1, "R"],
-                    moves += [self.position[0] - 1, "B"],
-                else:
-                    moves += [self.position[0] - 1, self.position[1] + 1],
-            # check if there is an en_passant opportunity
-            if board.en_passant and self.owner != board.en_passant.owner:
-                if board.en_passant.position == [self.position[0]+1,
-                                                 self.position[1]]:
-                    moves += [self.position[0]+1, self.position[1]+1],
-
-                elif board.en_passant.position == [self.position[0]-1,
-                                                   self.position[1]]:
-                    moves += [self.position[0]-1, self.position[1]+1],
-
-        if self.owner.color == Color.W:
-            if (self.first_move and
-                    board.check_if_empty([self.position[0],
-                                          self.position[1] - 1]) and
-                    board.check_if_empty([self.position[0],
-                                          self.position[1] - 2])):
-                moves += [self.position[0], self.position[1] - 2],
-            # Can move one space ahead if empty
-            if board.check_if_empty([self.position[0], self.position[1] - 1]):
-                if self.position[1] - 1 == 0:
-                    moves += [self.position[0], "Q"],
-                    moves += [self.position[0], "N"],
-                    moves += [self.position[0], "R"],
-                    moves += [self.position[0], "B"],
-                else:
-                    moves += [self.position[0], self.position[1] - 1],
-            # Can capture to the forward diagonals
-            if board.check_if_opponent([self.position[0] + 1,
-                                        self.position[1] - 1], self.owner):
-                if self.position[1] - 1 == 0:
-                    moves += [self.position[0] + 1, "Q"],
-                    moves += [self.position[0] + 1, "N"],
-                    moves += [self.position[0] + 1, "R"],
-                    moves += [self.position[0] + 1, "B"],
-                else:
-                    moves += [self.position[0] + 1, self.position[1] - 1],
-            if (board.check_if_opponent([self.position[0] - 1,
-                                         self.position[1] - 1], self.owner)):
-                if self.position[1] - 1 == 0:
-                    moves += [self.position[0] - 1, "Q"],
-                    moves += [self.position[0] - 1, "N"],
-                    moves += [self.position[0] - 1, "R"],
-                    moves += [self.position[0] - 1, "B"],
-                else:
-                    moves += [self.position[0] - 1, self.position[1] - 1],
-            if board.en_passant and self.owner != board.en_passant.owner:
-                if board.en_passant.position == [self.position[0]+1,
-                                                 self.position[1]]:
-                    moves += [self.position[0]+1, self.position[1]-1],
-
-                if board.en_passant.position == [self.position[0]-1,
-                                                 self.position[1]]:
-                    moves += [self.position[0]-1, self.position[1]-1],
-
-        if consider_checks:
-            moves = self.filter_checks(moves, board)
-        return moves
+    __slots__ = ()
+    kind = PAWN
 
     def __repr__(self):
         return self.owner.color.name+"P"
@@ -164,55 +157,8 @@ class Pawn(Piece):
 
 class Rook(Piece):
     """The rook piece."""
-
-    def get_legal_moves(self, board, consider_checks):
-        """Returns a list of all the legal moves for this piece
-        on this board."""
-        # Can move all spaces until blocked
-        moves = []
-        for x_coord in range(self.position[0]+1, 8):
-            if board.check_if_empty([x_coord, self.position[1]]):
-                moves += [x_coord, self.position[1]],
-            elif board.check_if_opponent([x_coord, self.position[1]],
-                                         self.owner):
-                moves += [x_coord, self.position[1]],
-                break
-            else:
-                # Your own piece or wall
-                break
-        for x_coord in range(self.position[0]-1, -1, -1):
-            if board.check_if_empty([x_coord, self.position[1]]):
-                moves += [x_coord, self.position[1]],
-            elif board.check_if_opponent([x_coord, self.position[1]],
-                                         self.owner):
-                moves += [x_coord, self.position[1]],
-                break
-            else:
-                # Your own piece or wall
-                break
-        for y_coord in range(self.position[1]+1, 8):
-            if board.check_if_empty([self.position[0], y_coord]):
-                moves += [self.position[0], y_coord],
-            elif board.check_if_opponent([self.position[0], y_coord],
-                                         self.owner):
-                moves += [self.position[0], y_coord],
-                break
-            else:
-                # Your own piece or wall
-                break
-        for y_coord in range(self.position[1]-1, -1, -1):
-            if board.check_if_empty([self.position[0], y_coord]):
-                moves += [self.position[0], y_coord],
-            elif board.check_if_opponent([self.position[0], y_coord],
-                                         self.owner):
-                moves += [self.position[0], y_coord],
-                break
-            else:
-                # Your own piece or wall
-                break
-        if consider_checks:
-            moves = self.filter_checks(moves, board)
-        return moves
+    __slots__ = ()
+    kind = ROOK
 
     def __repr__(self):
         return self.owner.color.name+"R"
@@ -220,61 +166,8 @@ class Rook(Piece):
 
 class Bishop(Piece):
     """The bishop piece, which moves diagonally."""
-
-    def get_legal_moves(self, board, consider_checks):
-        """Returns this piece's legal moves."""
-        moves = []
-        # Towards top right
-        helper = 0
-        for pos in range(self.position[1]-1, -1, -1):
-            helper += 1
-            if board.check_if_empty([self.position[0]+helper, pos]):
-                moves += [self.position[0]+helper, pos],
-            elif (board.check_if_opponent([self.position[0]+helper, pos],
-                                          self.owner)):
-                moves += [self.position[0]+helper, pos],
-                break
-            else:
-                break
-        # Toward top left
-        helper = 0
-        for pos in range(self.position[1]-1, -1, -1):
-            helper += 1
-            if board.check_if_empty([self.position[0]-helper, pos]):
-                moves += [self.position[0]-helper, pos],
-            elif board.check_if_opponent([self.position[0]-helper, pos],
-                                         self.owner):
-                moves += [self.position[0]-helper, pos],
-                break
-            else:
-                break
-        # Toward bottom left
-        helper = 0
-        for pos in range(self.position[0]-1, -1, -1):
-            helper += 1
-            if board.check_if_empty([pos, self.position[1]+helper]):
-                moves += [pos, self.position[1]+helper],
-            elif (board.check_if_opponent([pos, self.position[1]+helper],
-                                          self.owner)):
-                moves += [pos, self.position[1]+helper],
-                break
-            else:
-                break
-        # Toward bottom right
-        helper = 0
-        for pos in range(self.position[0]+1, 8):
-            helper += 1
-            if board.check_if_empty([pos, self.position[1]+helper]):
-                moves += [pos, self.position[1]+helper],
-            elif (board.check_if_opponent([pos, self.position[1]+helper],
-                                          self.owner)):
-                moves += [pos, self.position[1]+helper],
-                break
-            else:
-                break
-        if consider_checks:
-            moves = self.filter_checks(moves, board)
-        return moves
+    __slots__ = ()
+    kind = BISHOP
 
     def __repr__(self):
         return self.owner.color.name+"B"
@@ -282,53 +175,8 @@ class Bishop(Piece):
 
 class Knight(Piece):
     """The knight piece, which moves in an L shape."""
-
-    def get_legal_moves(self, board, consider_checks):
-        """Returns the knight's legal moves."""
-        moves = []
-        if (board.check_if_empty([self.position[0]+1, self.position[1]+2]) or
-                board.check_if_opponent([self.position[0]+1,
-                                         self.position[1]+2], self.owner)):
-            moves += [self.position[0]+1, self.position[1]+2],
-
-        if (board.check_if_empty([self.position[0]-1, self.position[1]+2]) or
-                board.check_if_opponent([self.position[0]-1,
-                                         self.position[1]+2], self.owner)):
-            moves += [self.position[0]-1, self.position[1]+2],
-
-        if (board.check_if_empty([self.position[0]+2, self.position[1]+1]) or
-                board.check_if_opponent([self.position[0]+2,
-                                         self.position[1]+1], self.owner)):
-            moves += [self.position[0]+2, self.position[1]+1],
-
-        if (board.check_if_empty([self.position[0]+2, self.position[1]-1]) or
-                board.check_if_opponent([self.position[0]+2,
-                                         self.position[1]-1], self.owner)):
-            moves += [self.position[0]+2, self.position[1]-1],
-
-        if (board.check_if_empty([self.position[0]+1, self.position[1]-2]) or
-                board.check_if_opponent([self.position[0]+1,
-                                         self.position[1]-2], self.owner)):
-            moves += [self.position[0]+1, self.position[1]-2],
-
-        if (board.check_if_empty([self.position[0]-1, self.position[1]-2]) or
-                board.check_if_opponent([self.position[0]-1,
-                                         self.position[1]-2], self.owner)):
-            moves += [self.position[0]-1, self.position[1]-2],
-
-        if (board.check_if_empty([self.position[0]-2, self.position[1]+1]) or
-                board.check_if_opponent([self.position[0]-2,
-                                         self.position[1]+1], self.owner)):
-            moves += [self.position[0]-2, self.position[1]+1],
-
-        if (board.check_if_empty([self.position[0]-2, self.position[1]-1]) or
-                board.check_if_opponent([self.position[0]-2,
-                                         self.position[1]-1], self.owner)):
-            moves += [self.position[0]-2, self.position[1]-1],
-
-        if consider_checks:
-            moves = self.filter_checks(moves, board)
-        return moves
+    __slots__ = ()
+    kind = KNIGHT
 
     def __repr__(self):
         return self.owner.color.name+"N"
@@ -336,97 +184,8 @@ class Knight(Piece):
 
 class Queen(Piece):
     """The queen piece, which moves in horizontal and diagonal directions."""
-
-    def get_legal_moves(self, board, consider_checks):
-        """Returns a list of all legal moves for this piece."""
-        moves = []
-        for pos in range(self.position[0]+1, 8):
-            if board.check_if_empty([pos, self.position[1]]):
-                moves += [pos, self.position[1]],
-            elif board.check_if_opponent([pos, self.position[1]], self.owner):
-                moves += [pos, self.position[1]],
-                break
-            else:
-                # Your own piece or wall
-                break
-        for pos in range(self.position[0]-1, -1, -1):
-            if board.check_if_empty([pos, self.position[1]]):
-                moves += [pos, self.position[1]],
-            elif board.check_if_opponent([pos, self.position[1]], self.owner):
-                moves += [pos, self.position[1]],
-                break
-            else:
-                # Your own piece or wall
-                break
-        for pos in range(self.position[1]+1, 8):
-            if board.check_if_empty([self.position[0], pos]):
-                moves += [self.position[0], pos],
-            elif board.check_if_opponent([self.position[0], pos], self.owner):
-                moves += [self.position[0], pos],
-                break
-            else:
-                # Your own piece or wall
-                break
-        for pos in range(self.position[1]-1, -1, -1):
-            if board.check_if_empty([self.position[0], pos]):
-                moves += [self.position[0], pos],
-            elif board.check_if_opponent([self.position[0], pos], self.owner):
-                moves += [self.position[0], pos],
-                break
-            else:
-                # Your own piece or wall
-                break
-        helper = 0
-        for pos in range(self.position[1]-1, -1, -1):
-            helper += 1
-            if board.check_if_empty([self.position[0]+helper, pos]):
-                moves += [self.position[0]+helper, pos],
-            elif board.check_if_opponent([self.position[0]+helper, pos],
-                                         self.owner):
-                moves += [self.position[0]+helper, pos],
-                break
-            else:
-                break
-        # Toward top left
-        helper = 0
-        for pos in range(self.position[1]-1, -1, -1):
-            helper += 1
-            if board.check_if_empty([self.position[0]-helper, pos]):
-                moves += [self.position[0]-helper, pos],
-            elif board.check_if_opponent([self.position[0]-helper, pos],
-                                         self.owner):
-                moves += [self.position[0]-helper, pos],
-                break
-            else:
-                break
-        # Toward bottom left
-        helper = 0
-        for pos in range(self.position[0]-1, -1, -1):
-            helper += 1
-            if board.check_if_empty([pos, self.position[1]+helper]):
-                moves += [pos, self.position[1]+helper],
-            elif board.check_if_opponent([pos, self.position[1]+helper],
-                                         self.owner):
-                moves += [pos, self.position[1]+helper],
-                break
-            else:
-                break
-        # Toward bottom right
-        helper = 0
-        for pos in range(self.position[0]+1, 8):
-            helper += 1
-            if board.check_if_empty([pos, self.position[1]+helper]):
-                moves += [pos, self.position[1]+helper],
-            elif board.check_if_opponent([pos, self.position[1]+helper],
-                                         self.owner):
-                moves += [pos, self.position[1]+helper],
-                break
-            else:
-                break
-
-        if consider_checks:
-            moves = self.filter_checks(moves, board)
-        return moves
+    __slots__ = ()
+    kind = QUEEN
 
     def __repr__(self):
         return self.owner.color.name+"Q"
@@ -434,80 +193,15 @@ class Queen(Piece):
 
 class King(Piece):
     """The king piece."""
-
-    def get_legal_moves(self, board, consider_checks):
-        """Returns the kings legal moves."""
-        moves = []
-        if (board.check_if_empty([self.position[0], self.position[1]+1]) or
-                board.check_if_opponent([self.position[0],
-                                         self.position[1]+1], self.owner)):
-            moves += [self.position[0], self.position[1]+1],
-
-        if (board.check_if_empty([self.position[0]+1, self.position[1]+1]) or
-                board.check_if_opponent([self.position[0]+1,
-                                         self.position[1]+1], self.owner)):
-            moves += [self.position[0]+1, self.position[1]+1],
-
-        if (board.check_if_empty([self.position[0]+1, self.position[1]]) or
-                board.check_if_opponent([self.position[0]+1,
-                                         self.position[1]], self.owner)):
-            moves += [self.position[0]+1, self.position[1]],
-
-        if (board.check_if_empty([self.position[0]+1, self.position[1]-1]) or
-                board.check_if_opponent([self.position[0]+1,
-                                         self.position[1]-1], self.owner)):
-            moves += [self.position[0]+1, self.position[1]-1],
-
-        if (board.check_if_empty([self.position[0], self.position[1]-1]) or
-                board.check_if_opponent([self.position[0],
-                                         self.position[1]-1], self.owner)):
-            moves += [self.position[0], self.position[1]-1],
-
-        if (board.check_if_empty([self.position[0]-1, self.position[1]-1]) or
-                board.check_if_opponent([self.position[0]-1,
-                                         self.position[1]-1], self.owner)):
-            moves += [self.position[0]-1, self.position[1]-1],
-
-        if (board.check_if_empty([self.position[0]-1, self.position[1]]) or
-                board.check_if_opponent([self.position[0]-1,
-                                         self.position[1]], self.owner)):
-            moves += [self.position[0]-1, self.position[1]],
-
-        if (board.check_if_empty([self.position[0]-1, self.position[1]+1]) or
-                board.check_if_opponent([self.position[0]-1,
-                                         self.position[1]+1], self.owner)):
-            moves += [self.position[0]-1, self.position[1]+1],
-
-        """
-        # rules of castling:
-        # 1. king cant be in check
-        # 2. king cannot travel through or land in attacked square
-        # 3. neither the king or castling rook can have moved
-        # 4. there must not be any pieces in between the king and rook
-        """
-        if consider_checks and self.first_move and not board.is_in_check(self.owner):
-            kingsiderook = board.get_piece_at_position([self.position[0]+3, self.position[1]])
-            if (kingsiderook and kingsiderook.owner == self.owner and kingsiderook.first_move and
-                board.check_if_empty([self.position[0]+1, self.position[1]]) and
-                    board.check_if_empty([self.position[0]+2, self.position[1]]) and
-                    not board.is_attacked([self.position[0]+1, self.position[1]], self.owner)):
-                # also need to make sure enemy pieces aren't attacking any square that king travels through.
-                moves += [self.position[0]+2, self.position[1]],
-            queensiderook = board.get_piece_at_position([self.position[0]-4, self.position[1]])
-            if (queensiderook and queensiderook.owner == self.owner and queensiderook.first_move and
-                board.check_if_empty([self.position[0]-1, self.position[1]]) and
-                    board.check_if_empty([self.position[0]-2, self.position[1]]) and
-                    board.check_if_empty([self.position[0]-3, self.position[1]]) and
-                    not board.is_attacked([self.position[0]-1, self.position[1]], self.owner)):
-                moves += [self.position[0]-2, self.position[1]],
-
-        if consider_checks:
-            moves = self.filter_checks(moves, board)
-        return moves
+    __slots__ = ()
+    kind = KING
 
     def __repr__(self):
         return self.owner.color.name+"K"
 
+# Piece classes, indexed by piece type.
+PIECE_CLASSES = [Pawn, Knight, Bishop, Rook, Queen, King]
+
 # ---------- Players -----------
 
 
@@ -518,10 +212,19 @@ class Color(Enum):
 
 
 class Player:
-    """Represents a player, which has a color."""
+    """Represents a player, which has a color. Players are shared by
+    every copy of a board, so copying one returns the player itself."""
+    __slots__ = ("color",)
+
     def __init__(self, color):
         self.color = color
 
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
     def __repr__(self):
         if self.color == Color.W:
             return "White"
@@ -532,30 +235,66 @@ class Player:
 
 
 class Board:
-    """Represents a standard 8x8 chess board."""
+    """Represents a standard 8x8 chess board. Pieces are kept both in the
+    board array and in bitboards: one per piece type and color, plus an
+    occupancy bitboard per color. Each color also has a piece list per
+    piece type and a cached king square.
+
+    The board knows whose turn it is (a Color value, flipped by make_move)
+    and keeps a Zobrist hash of the position, updated as pieces move.
+    Changing first_move flags or en_passant by hand leaves the hash
+    stale; call rehash afterwards. The running evaluation totals (see
+    evaluation.py) are updated as pieces move too."""
     def __init__(self, board=None, en_passant=None):
+        self.clear()
         # Passing in a board and pieces list.
         if board is not None:
-            self.board = deepcopy(board)
-            self.en_passant = deepcopy(en_passant)
-            self.pieces = []
-            for piece in self.board:
+            board, en_passant = deepcopy((board, en_passant))
+            for piece in board:
                 if piece:
-                    self.pieces += piece,
-        # Fresh game.
-        else:
-            self.board = [None for x in range(0, 64)]
-            self.pieces = []
-            self.en_passant = None
+                    self.add_to_board(piece)
+            self.en_passant = en_passant
+            self.rehash()
+
+    def clear(self):
+        """Removes every piece, leaving an empty board."""
+        self.board = [None for x in range(0, 64)]
+        # piece_lists[color][kind] is a dict used as an ordered set, so
+        # pieces are added and removed in constant time.
+        self.piece_lists = [[{} for kind in range(6)] for color in range(2)]
+        self.king_squares = [None, None]
+        self.en_passant = None
+        # Undo records pushed by make_move, most recent last.
+        self.move_stack = []
+        # bitboards[color][kind], colors indexed by Color value.
+        self.bitboards = [[0] * 6, [0] * 6]
+        self.occupied = [0, 0]
+        self.turn = Color.W.value
+        self.castling = 0
+        self.hash = 0
+        # White minus black material and piece-square totals, and the
+        # game phase.
+        self.mg_score = 0
+        self.eg_score = 0
+        self.phase = 0
+
+    @property
+    def pieces(self):
+        """Every piece on the board, white's first, grouped by type."""
+        return [piece for lists in self.piece_lists
+                for pieces in lists for piece in pieces]
+
+    @property
+    def occupancy(self):
+        """Bitboard of every occupied square."""
+        return self.occupied[0] | self.occupied[1]
 
     def check_if_empty(self, position):
         """Returns True if the position (xy format) is empty."""
         if fails_bounds_check(position):
             return False
-        if self.board[xy_to_num(position)] == None:
-            return True
-        else:
-            return False
+        occupancy = self.occupied[0] | self.occupied[1]
+        return not occupancy >> xy_to_num(position) & 1
 
     def get_piece_at_position(self, position):
         """Returns the piece at the position (xy format), or None
@@ -568,168 +307,691 @@ class Board:
         """Returns True if the piece at the position does not belong to
         the player. False if the position is empty or the piece
         belongs to the owner."""
-        piece = self.get_piece_at_position(position)
-        if piece:
-            return piece.owner != owner
-        return False
+        if fails_bounds_check(position):
+            return False
+        theirs = self.occupied[1 - owner.color.value]
+        return bool(theirs >> xy_to_num(position) & 1)
+
+    def get_pieces(self, color):
+        """Returns the pieces of the color (a Color value), grouped by piece
+        type."""
+        return [piece for pieces in self.piece_lists[color]
+                for piece in pieces]
+
+    def castling_rights(self):
+        """Returns the castling rights left by the first_move flags of the
+        kings and rooks on their home squares, as bits: 1 white kingside,
+        2 white queenside, 4 black kingside, 8 black queenside."""
+        rights = 0
+        for color, home in ((Color.W.value, 60), (Color.B.value, 4)):
+            king = self.board[home]
+            if (king is None or king.kind != KING or king.color != color or
+                    not king.first_move):
+                continue
+            for bit, rook_square in ((1, home + 3), (2, home - 4)):
+                rook = self.board[rook_square]
+                if (rook is not None and rook.kind == ROOK and
+                        rook.color == color and rook.first_move):
+                    rights |= bit << 2 * color
+        return rights
+
+    def snapshot(self):
+        """Returns the position as a tuple of ints: the twelve bitboards,
+        white's first, then the en passant pawn's square (-1 if none), the
+        castling rights and the side to move. Snapshots are hashable and
+        much smaller than a board, and taking one allocates no pieces."""
+        en_passant = -1 if self.en_passant is None else self.en_passant.square
+        return (*self.bitboards[0], *self.bitboards[1],
+                en_passant, self.castling_rights(), self.turn)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, white, black):
+        """Builds a board from a snapshot, with pieces owned by the
+        players. Only kings and rooks holding castling rights and pawns
+        on their starting rank keep first_move set."""
+        board = cls()
+        for color, owner in enumerate((white, black)):
+            for kind in range(6):
+                pieces = board.piece_lists[color][kind]
+                for square in bits(snapshot[color * 6 + kind]):
+                    piece = PIECE_CLASSES[kind](owner, num_to_xy(square))
+                    piece.first_move = (kind == PAWN and
+                                        square >> 3 == (6, 1)[color])
+                    board._place(piece, square)
+                    pieces[piece] = None
+        rights = snapshot[13]
+        for color, home in ((Color.W.value, 60), (Color.B.value, 4)):
+            king = board.board[home]
+            for bit, rook_square in ((1, home + 3), (2, home - 4)):
+                rook = board.board[rook_square]
+                # A right whose king or rook is not at home cannot be
+                # used, and is dropped.
+                if (rights >> 2 * color & bit and
+                        king is not None and king.kind == KING and
+                        king.color == color and
+                        rook is not None and rook.kind == ROOK and
+                        rook.color == color):
+                    king.first_move = True
+                    rook.first_move = True
+        if snapshot[12] >= 0:
+            board.en_passant = board.board[snapshot[12]]
+        board.turn = snapshot[14]
+        board.rehash()
+        return board
+
+    @classmethod
+    def from_fen(cls, fen, white, black):
+        """Builds a board from the placement, side to move, castling and
+        en passant fields of a FEN string, with pieces owned by the
+        players. Any further fields are ignored, and missing ones default
+        to white to move with no castling rights or en passant."""
+        fields = fen.split()
+        fields += ["w", "-", "-"][max(len(fields) - 1, 0):]
+        bitboards = [0] * 12
+        square = 0
+        for char in fields[0]:
+            if char.isdigit():
+                square += int(char)
+            elif char != "/":
+                kind = PIECE_LETTERS.index(char.upper())
+                bitboards[kind + 6 * char.islower()] |= 1 << square
+                square += 1
+        rights = 0
+        for bit, char in enumerate("KQkq"):
+            if char in fields[2]:
+                rights |= 1 << bit
+        # The en passant field names the square passed over, the pawn
+        # stands one rank further on.
+        en_passant = -1
+        if fields[3] != "-":
+            target = ord(fields[3][0]) - ord("a") + 8 * (8 - int(fields[3][1]))
+            en_passant = target - 8 if target >> 3 == 5 else target + 8
+        turn = Color.B.value if fields[1] == "b" else Color.W.value
+        return cls.from_snapshot((*bitboards, en_passant, rights, turn),
+                                 white, black)
+
+    def to_fen(self, halfmove_clock=0, fullmove_number=1):
+        """Returns the FEN string of the position. The board does not keep
+        the move counters, they are passed in (see Game.to_fen)."""
+        rows = []
+        for rank in range(8):
+            row = ""
+            empty = 0
+            for piece in self.board[rank * 8:rank * 8 + 8]:
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    row += str(empty)
+                    empty = 0
+                letter = PIECE_LETTERS[piece.kind]
+                if piece.color == Color.B.value:
+                    letter = letter.lower()
+                row += letter
+            rows += row + (str(empty) if empty else ""),
+        rights = self.castling_rights()
+        castling = "".join(char for bit, char in enumerate("KQkq")
+                           if rights >> bit & 1) or "-"
+        en_passant = "-"
+        if self.en_passant is not None:
+            # The square the pawn passed over.
+            en_passant = square_name(self.en_passant.square +
+                                     (8, -8)[self.en_passant.color])
+        return " ".join(("/".join(rows), "wb"[self.turn], castling,
+                         en_passant, str(halfmove_clock),
+                         str(fullmove_number)))
+
+    def compute_hash(self):
+        """Computes the Zobrist hash of the position from scratch. Used to
+        check the incrementally updated hash."""
+        key = CASTLING_KEYS[self.castling_rights()] ^ self._en_passant_key()
+        if self.turn == Color.B.value:
+            key ^= SIDE_KEY
+        for color in range(2):
+            for kind in range(6):
+                keys = PIECE_KEYS[color][kind]
+                for square in bits(self.bitboards[color][kind]):
+                    key ^= keys[square]
+        return key
+
+    def rehash(self):
+        """Recomputes the castling rights and hash from scratch."""
+        self.castling = self.castling_rights()
+        self.hash = self.compute_hash()
+
+    def _update_castling(self):
+        """Brings the castling rights, and their part of the hash, up to
+        date with the first_move flags."""
+        rights = self.castling_rights()
+        self.hash ^= CASTLING_KEYS[self.castling ^ rights]
+        self.castling = rights
+
+    def en_passant_capturable(self):
+        """Returns True if there is an en passant pawn with an enemy pawn
+        beside it to take it. Pins are not looked at, as in the usual
+        hashing schemes."""
+        pawn = self.en_passant
+        if pawn is None:
+            return False
+        bit = 1 << pawn.square
+        return bool(((bit << 1) & NOT_A_FILE | (bit >> 1) & NOT_H_FILE) &
+                    self.bitboards[1 - pawn.color][PAWN])
+
+    def _en_passant_key(self):
+        """Returns the en passant file key, or 0 if the en passant pawn
+        cannot be taken."""
+        if self.en_passant_capturable():
+            return EN_PASSANT_KEYS[self.en_passant.square & 7]
+        return 0
 
     def add_to_board(self, piece):
         """Adds the piece to the board using the piece's position.
         If there is already a piece there, do nothing."""
-        pos = piece.position
-        if self.check_if_empty(pos):
-            self.board[xy_to_num(pos)] = piece
-            self.pieces += piece,
+        if self.check_if_empty(piece.position):
+            self._place(piece, piece.square)
+            self.piece_lists[piece.color][piece.kind][piece] = None
+            if CASTLING_SQUARES >> piece.square & 1:
+                self._update_castling()
 
     def undo_move(self):
         """Restores the board to one move prior. Returns None if no
         moves have been made yet."""
-        piece = self.get_piece_at_position(self.last_move_new_position)
-        self.remove_from_board(self.last_move_new_position)
-        piece.position = self.last_move_prev_position
-        self.add_to_board(piece)
-        if self.last_move_captured_piece:
-            self.add_to_board(self.last_move_captured_piece)
+        return self.unmake_move()
 
     def remove_from_board(self, position):
         """Removes the piece from the board, using the passed in position.
         Returns None if no piece was removed. Otherwise returns the piece."""
-        piece = self.board[xy_to_num(position)]
+        square = xy_to_num(position)
+        piece = self.board[square]
         if piece is None:
             return None
-        if piece in self.pieces:
-            self.pieces.remove(piece)
-            self.board[xy_to_num(position)] = None
+        color = piece.color
+        pieces = self.piece_lists[color][piece.kind]
+        if piece in pieces:
+            del pieces[piece]
+            if piece.kind == KING:
+                self.king_squares[color] = None
+            self._lift(square)
+            if CASTLING_SQUARES >> square & 1:
+                self._update_castling()
             return piece
 
+    def _place(self, piece, square):
+        """Puts the piece on the empty square and updates its position.
+        Unlike add_to_board, the piece lists are left alone."""
+        bit = 1 << square
+        color = piece.color
+        kind = piece.kind
+        piece.square = square
+        self.board[square] = piece
+        self.bitboards[color][kind] |= bit
+        self.occupied[color] |= bit
+        self.hash ^= PIECE_KEYS[color][kind][square]
+        self.mg_score += MG_TABLES[color][kind][square]
+        self.eg_score += EG_TABLES[color][kind][square]
+        self.phase += PHASE_WEIGHTS[kind]
+        if kind == KING:
+            self.king_squares[color] = square
+
+    def _lift(self, square):
+        """Takes the piece off the occupied square and returns it, leaving
+        its position untouched. The piece lists are left alone."""
+        piece = self.board[square]
+        bit = 1 << square
+        color = piece.color
+        kind = piece.kind
+        self.board[square] = None
+        self.bitboards[color][kind] ^= bit
+        self.occupied[color] ^= bit
+        self.hash ^= PIECE_KEYS[color][kind][square]
+        self.mg_score -= MG_TABLES[color][kind][square]
+        self.eg_score -= EG_TABLES[color][kind][square]
+        self.phase -= PHASE_WEIGHTS[kind]
+        return piece
+
     def is_in_check(self, owner):
         """Returns true if the owner is in check (any of the opponent's pieces
             threaten the King.)"""
-        for piece in self.pieces:
-            # piece exists and belongs to opponent.
-            if piece.owner != owner:
-                # The False here specifies that we should get ALL moves, even
-                # those that would leave the opponent King in check.
-                moves = piece.get_legal_moves(self, False)
-                for move in moves:
-                    piece = self.get_piece_at_position(move)
-                    if isinstance(piece, King) and piece.owner == owner:
-                        return True
-        return False
+        king = self.king_squares[owner.color.value]
+        if king is None:
+            return False
+        return self.is_square_attacked(king, 1 - owner.color.value,
+                                       self.occupied[0] | self.occupied[1])
 
     def is_attacked(self, position, owner):
         """Returns true if the position is attacked by the opponent."""
-        for piece in self.pieces:
-            if piece.owner != owner:
-                moves = piece.get_legal_moves(self, False)
-                for move in moves:
-                    if move == position:
-                        return True
-        return False
+        return self.is_square_attacked(xy_to_num(position),
+                                       1 - owner.color.value,
+                                       self.occupied[0] | self.occupied[1])
+
+    def is_square_attacked(self, square, color, occupancy):
+        """Returns True if any of the color's (a Color value) pieces attack
+        the square. Works backwards from the square: each piece type's
+        attacks are cast from it and checked against the pieces that move
+        that way, returning on the first hit."""
+        theirs = self.bitboards[color]
+        if PAWN_ATTACKS[1 - color][square] & theirs[PAWN]:
+            return True
+        if KNIGHT_ATTACKS[square] & theirs[KNIGHT]:
+            return True
+        if KING_ATTACKS[square] & theirs[KING]:
+            return True
+        queens = theirs[QUEEN]
+        if (theirs[BISHOP] | queens) and (bishop_attacks(square, occupancy) &
+                                          (theirs[BISHOP] | queens)):
+            return True
+        return bool((theirs[ROOK] | queens) and
+                    rook_attacks(square, occupancy) & (theirs[ROOK] | queens))
+
+    def attackers_to(self, square, color, occupancy):
+        """Returns the bitboard of the color's (a Color value) pieces that
+        attack the square, with sliders blocked by the occupancy."""
+        theirs = self.bitboards[color]
+        return ((KNIGHT_ATTACKS[square] & theirs[KNIGHT]) |
+                (KING_ATTACKS[square] & theirs[KING]) |
+                (PAWN_ATTACKS[1 - color][square] & theirs[PAWN]) |
+                (rook_attacks(square, occupancy) &
+                 (theirs[ROOK] | theirs[QUEEN])) |
+                (bishop_attacks(square, occupancy) &
+                 (theirs[BISHOP] | theirs[QUEEN])))
+
+    def generate_moves(self, color, from_mask=FULL, legal=True):
+        """Generates the packed moves of the color's pieces standing on the
+        from_mask squares. Moves come grouped by piece type, then by
+        square, with each piece's captures ahead of its quiet moves.
+
+        With legal set only legal moves are generated. The king's checkers
+        and pinned pieces are worked out once; evasions and pin rays then
+        narrow the target squares, so no move has to be tried on the board.
+        Without it, moves that leave the king in check are kept and
+        castling is skipped."""
+        moves = []
+        ours = self.bitboards[color]
+        enemy = self.occupied[1 - color]
+        occupancy = self.occupied[color] | enemy
+        king = self.king_squares[color]
+        targets, checkers, pinned = self._check_masks(color, legal)
+
+        if targets:
+            self._generate_pawn_moves(moves, color, from_mask, targets,
+                                      pinned, checkers, legal)
+            for square in bits(ours[KNIGHT] & from_mask & ~pinned):
+                allowed = KNIGHT_ATTACKS[square] & targets
+                for to_square in bits(allowed & enemy):
+                    moves += square | to_square << 6 | CAPTURE,
+                for to_square in bits(allowed & ~enemy):
+                    moves += square | to_square << 6,
+            for kind, attacks in ((BISHOP, bishop_attacks),
+                                  (ROOK, rook_attacks),
+                                  (QUEEN, queen_attacks)):
+                for square in bits(ours[kind] & from_mask):
+                    allowed = attacks(square, occupancy) & targets
+                    if pinned >> square & 1:
+                        allowed &= LINE[king][square]
+                    for to_square in bits(allowed & enemy):
+                        moves += square | to_square << 6 | CAPTURE,
+                    for to_square in bits(allowed & ~enemy):
+                        moves += square | to_square << 6,
+
+        for square in bits(ours[KING] & from_mask):
+            self._generate_king_moves(moves, color, square, checkers, legal)
+        return moves
 
-    def get_all_legal_moves(self, owner):
+    def count_moves(self, color):
+        """Returns the number of legal moves of the color, the same as
+        len(generate_moves(color)). Knight and slider moves are counted
+        straight off their target bitboards instead of being generated,
+        which makes counting the leaves of a search tree cheap."""
+        moves = []
+        ours = self.bitboards[color]
+        occupancy = self.occupied[0] | self.occupied[1]
+        king = self.king_squares[color]
+        targets, checkers, pinned = self._check_masks(color, True)
+        count = 0
+        if targets:
+            count += self._count_pawn_moves(moves, color, targets, pinned,
+                                            checkers)
+            for square in bits(ours[KNIGHT] & ~pinned):
+                count += popcount(KNIGHT_ATTACKS[square] & targets)
+            for kind, attacks in ((BISHOP, bishop_attacks),
+                                  (ROOK, rook_attacks),
+                                  (QUEEN, queen_attacks)):
+                for square in bits(ours[kind]):
+                    allowed = attacks(square, occupancy) & targets
+                    if pinned >> square & 1:
+                        allowed &= LINE[king][square]
+                    count += popcount(allowed)
+        if king is not None:
+            self._generate_king_moves(moves, color, king, checkers, True)
+        return count + len(moves)
+
+    def _count_pawn_moves(self, moves, color, targets, pinned, checkers):
+        """Only called by count_moves. Counts the moves of all the pawns at
+        once by shifting them, apart from pinned pawns and pawns that can
+        take en passant, whose moves are added to moves instead."""
+        pawns = self.bitboards[color][PAWN]
+        enemy = self.occupied[1 - color] & targets
+        empty = ~(self.occupied[0] | self.occupied[1]) & FULL
+        single = pawns & pinned
+        if (self.en_passant is not None and
+                self.en_passant.color != color):
+            ep_to = self.en_passant.square + (-8, 8)[color]
+            single |= PAWN_ATTACKS[1 - color][ep_to] & pawns
+        if single:
+            self._generate_pawn_moves(moves, color, single, targets,
+                                      pinned, checkers, True)
+        pawns &= ~single
+        if color == Color.W.value:
+            pushes = pawns >> 8 & empty
+            doubles = (pushes & RANK_3) >> 8 & empty & targets
+            captures = (pawns >> 9 & NOT_H_FILE, pawns >> 7 & NOT_A_FILE)
+            last_rank = RANK_8
+        else:
+            pushes = pawns << 8 & empty
+            doubles = (pushes & RANK_6) << 8 & empty & targets
+            captures = (pawns << 7 & NOT_H_FILE, pawns << 9 & NOT_A_FILE)
+            last_rank = RANK_1
+        count = popcount(doubles)
+        for destinations in (pushes & targets, captures[0] & enemy,
+                             captures[1] & enemy):
+            # Promotions count once per piece that can be chosen.
+            count += (popcount(destinations & ~last_rank) +
+                      len(PROMOTION_KINDS) *
+                      popcount(destinations & last_rank))
+        return count
+
+    def _check_masks(self, color, legal):
+        """Only called by generate_moves and count_moves. Returns the
+        squares the pieces other than the king may move to, the pieces
+        checking the king and our pieces pinned to it."""
+        own = self.occupied[color]
+        enemy = self.occupied[1 - color]
+        king = self.king_squares[color]
+        targets = ~own & FULL
+        checkers = pinned = 0
+        if legal and king is not None:
+            theirs = self.bitboards[1 - color]
+            checkers = self.attackers_to(king, 1 - color, own | enemy)
+            if checkers & (checkers - 1):
+                # Double check, only the king can move.
+                targets = 0
+            elif checkers:
+                # Capture the checker or block it.
+                targets = checkers | BETWEEN[king][lsb(checkers)]
+            # Sliders that see the king through exactly one of our pieces
+            # pin it to the line between them.
+            snipers = ((rook_attacks(king, enemy) &
+                        (theirs[ROOK] | theirs[QUEEN])) |
+                       (bishop_attacks(king, enemy) &
+                        (theirs[BISHOP] | theirs[QUEEN])))
+            for sniper in bits(snipers):
+                blockers = BETWEEN[king][sniper] & own
+                if blockers and not blockers & (blockers - 1):
+                    pinned |= blockers
+        return targets, checkers, pinned
+
+    def _generate_king_moves(self, moves, color, square, checkers, legal):
+        """Only called by generate_moves and count_moves. Adds the moves
+        of the king on square, castling included."""
+        own = self.occupied[color]
+        enemy = self.occupied[1 - color]
+        # The king is taken off the board while testing its moves, so
+        # it cannot hide behind itself from a slider.
+        without_king = (own | enemy) ^ (1 << square)
+        allowed = KING_ATTACKS[square] & ~own
+        for flags, destinations in ((CAPTURE, allowed & enemy),
+                                    (0, allowed & ~enemy)):
+            for to_square in bits(destinations):
+                if not legal or not self.is_square_attacked(
+                        to_square, 1 - color, without_king):
+                    moves += square | to_square << 6 | flags,
+        if legal and not checkers:
+            self._generate_castle_moves(moves, color, square)
+
+    def _generate_pawn_moves(self, moves, color, from_mask, targets,
+                             pinned, checkers, legal):
+        """Only called by generate_moves. Adds the pawn moves, including
+        double pushes, promotions and en passant."""
+        occupancy = self.occupied[0] | self.occupied[1]
+        enemy = self.occupied[1 - color]
+        king = self.king_squares[color]
+        if color == Color.W.value:
+            forward, start_rank, last_rank = -8, 6, 0
+        else:
+            forward, start_rank, last_rank = 8, 1, 7
+        # The square a pawn lands on when taking the en passant pawn.
+        ep_square = ep_to = None
+        if (self.en_passant is not None and
+                self.en_passant.color != color):
+            ep_square = self.en_passant.square
+            ep_to = ep_square + forward
+
+        for square in bits(self.bitboards[color][PAWN] & from_mask):
+            allowed = targets
+            if pinned >> square & 1:
+                allowed &= LINE[king][square]
+            captures = PAWN_ATTACKS[color][square] & enemy & allowed
+            to_square = square + forward
+            pushes = 0
+            if not occupancy >> to_square & 1:
+                pushes = 1 << to_square & allowed
+                if (square >> 3 == start_rank and
+                        not occupancy >> (to_square + forward) & 1 and
+                        allowed >> (to_square + forward) & 1):
+                    moves += (square | (to_square + forward) << 6 |
+                              DOUBLE_PUSH),
+            for flags, destinations in ((CAPTURE, captures), (0, pushes)):
+                for to_square in bits(destinations):
+                    move = square | to_square << 6 | flags
+                    if to_square >> 3 == last_rank:
+                        for kind in PROMOTION_KINDS:
+                            moves += move | kind << 12,
+                    else:
+                        moves += move,
+
+            if ep_to is not None and PAWN_ATTACKS[color][square] >> ep_to & 1:
+                # Both pawns leave the rank at once, which the pin test
+                # cannot see, so the king is tested directly instead.
+                if not legal or self._en_passant_is_legal(
+                        color, square, ep_square, ep_to, checkers):
+                    moves += square | ep_to << 6 | CAPTURE | EN_PASSANT,
+
+    def _en_passant_is_legal(self, color, square, ep_square, ep_to, checkers):
+        """Returns True if the pawn on square can take the en passant pawn
+        without leaving its king in check."""
+        king = self.king_squares[color]
+        if king is None:
+            return True
+        theirs = self.bitboards[1 - color]
+        # Knights and pawns other than the one taken keep on checking.
+        if checkers & ~(1 << ep_square) & (theirs[KNIGHT] | theirs[PAWN]):
+            return False
+        after = ((self.occupied[0] | self.occupied[1]) ^ (1 << square) ^
+                 (1 << ep_square) | (1 << ep_to))
+        return not (rook_attacks(king, after) &
+                    (theirs[ROOK] | theirs[QUEEN]) or
+                    bishop_attacks(king, after) &
+                    (theirs[BISHOP] | theirs[QUEEN]))
+
+    def _generate_castle_moves(self, moves, color, square):
+        """Only called by generate_moves, when the king is not in check.
+        Rules of castling:
+        1. king cant be in check
+        2. king cannot travel through or land in attacked square
+        3. neither the king or castling rook can have moved
+        4. there must not be any pieces in between the king and rook"""
+        if color == Color.W.value:
+            home = 60  # e1
+        else:
+            home = 4  # e8
+        if square != home or not self.board[square].first_move:
+            return
+        occupancy = self.occupied[0] | self.occupied[1]
+        for rook_square, path, step in ((home + 3, 0b11 << home + 1, 1),
+                                        (home - 4, 0b111 << home - 3, -1)):
+            rook = self.board[rook_square]
+            if (rook is not None and rook.kind == ROOK and
+                    rook.color == color and rook.first_move and
+                    not occupancy & path and
+                    not self.is_square_attacked(home + step, 1 - color,
+                                                occupancy) and
+                    not self.is_square_attacked(home + 2 * step, 1 - color,
+                                                occupancy)):
+                moves += square | (home + 2 * step) << 6 | CASTLE,
+
+    def get_all_legal_moves(self, owner, packed=False):
         """Gets the legal moves for all the player's pieces, and stores them
-        in a list of [piece, move_position] format."""
-        legal_moves = []
-        for piece in self.pieces:
-            if piece.owner.color is owner.color:
-                for move in piece.get_legal_moves(self, True):
-                    legal_moves += [piece, move],
-        return legal_moves
-
-    def make_move(self, piece, to_position):
-        """Make a move. Handles captures. Checks for en_passant."""
-        self.remove_from_board(piece.position)
+        in a list of [piece, move_position] format. With packed set the
+        packed moves are returned instead."""
+        moves = self.generate_moves(owner.color.value)
+        if packed:
+            return moves
+        board = self.board
+        return [[board[move & 63], move_position(move)] for move in moves]
+
+    def pack_move(self, piece, to_position):
+        """Converts a move in [piece, move_position] form, as returned by
+        get_all_legal_moves, to a packed move, working out its flags from
+        the board."""
+        from_square = piece.square
+        if isinstance(to_position[1], str):
+            if piece.color == Color.W.value:
+                to_square = to_position[0]
+            else:
+                to_square = to_position[0] + 56
+            move = PIECE_LETTERS.index(to_position[1]) << 12
+        else:
+            to_square = xy_to_num(to_position)
+            move = 0
+        move |= from_square | to_square << 6
+        if self.board[to_square] is not None:
+            move |= CAPTURE
+        if piece.kind == PAWN:
+            if abs(to_square - from_square) == 16:
+                move |= DOUBLE_PUSH
+            # a pawn moving diagonally to an empty square takes en passant
+            elif (to_square - from_square) & 7 and not move & CAPTURE:
+                move |= CAPTURE | EN_PASSANT
+        elif piece.kind == KING and abs(to_square - from_square) == 2:
+            move |= CASTLE
+        return move
+
+    def unpack_move(self, move):
+        """Converts a packed move to [piece, move_position] form."""
+        return [self.board[move & 63], move_position(move)]
+
+    def make_move(self, move, to_position=None):
+        """Make a move. Handles captures. Checks for en_passant.
+        The move is either packed, or a piece followed by the position it
+        moves to. Pushes an undo record onto move_stack so that
+        unmake_move can take the move back. The hash is updated as the
+        pieces move, the en passant, castling and side keys here."""
+        if to_position is not None:
+            move = self.pack_move(move, to_position)
+        piece = self.board[move & 63]
+        first_move = piece.first_move
+        en_passant = self.en_passant
+        self.hash ^= self._en_passant_key()
+        self.en_passant = None
+        captured = promoted = castle = None
         # Handle all pawn moves including en_passant and promotion
-        if isinstance(piece, Pawn):
-            self.make_pawn_move(piece, to_position)
+        if piece.kind == PAWN:
+            captured, promoted = self.make_pawn_move(piece, move)
 
         # castling
-        elif (isinstance(piece, King) and
-              (abs(piece.position[0] - to_position[0]) > 1)):
-            self.make_castle_move(piece, to_position)
+        elif move & CASTLE:
+            castle = self.make_castle_move(move)
 
         else:
-            piece.position = to_position
-
-            self.en_passant = None
-            self.remove_from_board(to_position)
-            self.add_to_board(piece)
+            to_square = move >> 6 & 63
+            if move & CAPTURE:
+                captured = self.remove_from_board([to_square & 7,
+                                                   to_square >> 3])
+            self._place(self._lift(move & 63), to_square)
 
         piece.first_move = False
-
-    def make_pawn_move(self, piece, to_position):
-        """Only called by make_move. Aesthetic function to tidy up make_move"""
-        if isinstance(to_position[1], str):
-            if to_position[1] == "Q":
-                piece = Queen(piece.owner, [to_position[0], -1])
-            elif to_position[1] == "N":
-                piece = Knight(piece.owner, [to_position[0], -1])
-            elif to_position[1] == "B":
-                piece = Bishop(piece.owner, [to_position[0], -1])
-            elif to_position[1] == "R":
-                piece = Rook(piece.owner, [to_position[0], -1])
-            if piece.owner.color == Color.W:
-                piece.position[1] = 0
-            else:
-                piece.position[1] = 7
-            self.remove_from_board(piece.position)
-
-            self.en_passant = None
-            self.add_to_board(piece)
-
-        elif (piece.position[1] + 2 == to_position[1] or
-              piece.position[1] - 2 == to_position[1]):
-            piece.position = to_position
-
-            self.en_passant = piece  # en_passant is possible on next turn
-            self.remove_from_board(to_position)
-            self.add_to_board(piece)
-
-        # en passant is being performed if we capturing an empty diagonal square with a pawn
-        elif ((piece.position[1] + 1 == to_position[1] or
-               piece.position[1] - 1 == to_position[1]) and
-              ((piece.position[0] + 1 == to_position[0] and
-                self.check_if_empty(to_position)) or
-               (piece.position[0] - 1 == to_position[0] and
-                self.check_if_empty(to_position)))):
-
-            self.remove_from_board(self.en_passant.position)
-
-            piece.position = to_position
-
-            self.en_passant = None
+        if CASTLING_SQUARES & (1 << (move & 63) | 1 << (move >> 6 & 63)):
+            self._update_castling()
+        self.hash ^= self._en_passant_key() ^ SIDE_KEY
+        self.turn ^= 1
+        self.move_stack += (move, piece, first_move, en_passant,
+                            captured, promoted, castle),
+
+    def unmake_move(self):
+        """Takes back the last move made with make_move, restoring the
+        board exactly. Returns None if no moves have been made yet,
+        otherwise the piece that was moved."""
+        if not self.move_stack:
+            return None
+        (move, piece, first_move, en_passant,
+         captured, promoted, castle) = self.move_stack.pop()
+        from_square = move & 63
+        self.hash ^= self._en_passant_key() ^ SIDE_KEY
+        self.turn ^= 1
+        if promoted:
+            self.remove_from_board(promoted.position)
+            piece.square = from_square
             self.add_to_board(piece)
-
         else:
-            piece.position = to_position
-
-            self.en_passant = None
-            self.remove_from_board(to_position)
-            self.add_to_board(piece)
-
-    def make_castle_move(self, piece, to_position):
-        """Only called by make_move. Handles castling. Aesthetic."""
+            self._place(self._lift(move >> 6 & 63), from_square)
+        if castle:
+            rook, rook_square, rook_first_move = castle
+            self._place(self._lift(rook.square), rook_square)
+            rook.first_move = rook_first_move
+        # Captured pieces keep the position they were captured on.
+        if captured:
+            self.add_to_board(captured)
+        piece.first_move = first_move
+        self.en_passant = en_passant
+        if CASTLING_SQUARES & (1 << from_square | 1 << (move >> 6 & 63)):
+            self._update_castling()
+        self.hash ^= self._en_passant_key()
+        return piece
+
+    def make_pawn_move(self, piece, move):
+        """Only called by make_move. Aesthetic function to tidy up make_move.
+        Returns the captured piece and the promoted piece (or None)."""
+        from_square = move & 63
+        to_square = move >> 6 & 63
+        captured = promoted = None
+        if move & EN_PASSANT:
+            # the captured pawn sits beside us, on the file we move to.
+            captured = self.remove_from_board([to_square & 7,
+                                               from_square >> 3])
+        elif move & CAPTURE:
+            captured = self.remove_from_board([to_square & 7,
+                                               to_square >> 3])
+
+        if move >> 12 & 7:
+            promoted = PIECE_CLASSES[move >> 12 & 7](
+                piece.owner, [to_square & 7, to_square >> 3])
+            # A promoted rook can never castle.
+            promoted.first_move = False
+            self.remove_from_board(piece.position)
+            self.add_to_board(promoted)
+        else:
+            self._place(self._lift(from_square), to_square)
+            if move & DOUBLE_PUSH:
+                self.en_passant = piece  # en_passant is possible on next turn
+        return captured, promoted
+
+    def make_castle_move(self, move):
+        """Only called by make_move. Handles castling. Aesthetic.
+        Returns the rook, its square and first_move flag before castling."""
+        from_square = move & 63
+        to_square = move >> 6 & 63
         # kingside
-        if piece.position[0] - to_position[0] == -2:
-            piece.position = to_position
-            self.add_to_board(piece)
-            rook = self.get_piece_at_position([to_position[0]+1, to_position[1]])
-            self.remove_from_board(rook.position)
-            rook.position = [rook.position[0] - 2, rook.position[1]]
-            self.add_to_board(rook)
+        if to_square > from_square:
+            rook_square, rook_to = to_square + 1, to_square - 1
         # queenside
-        elif piece.position[0] - to_position[0] == 2:
-            piece.position = to_position
-            self.add_to_board(piece)
-            rook = self.get_piece_at_position([to_position[0]-2, to_position[1]])
-            self.remove_from_board(rook.position)
-            rook.position = [rook.position[0] + 3, rook.position[1]]
-            self.add_to_board(rook)
         else:
-            raise Exception
-
-        self.en_passant = None
+            rook_square, rook_to = to_square - 2, to_square + 1
+        self._place(self._lift(from_square), to_square)
+        rook = self._lift(rook_square)
+        self._place(rook, rook_to)
+        castle = rook, rook_square, rook.first_move
+        rook.first_move = False
+        return castle
 
     def __repr__(self):
         rep = "     0     1     2     3     4     5     6     7  \n"
@@ -752,19 +1014,21 @@ class Board:
 
 class Game():
     """Contains a game, players, and pieces."""
-    def __init__(self, board=Board(),
+    def __init__(self, board=None,
                  white=Player(Color.W),
                  black=Player(Color.B)):
-        self.board = board
+        # Each game gets its own board unless one is passed in.
+        self.board = Board() if board is None else board
         self.white = white
         self.black = black
         self.current_turn = self.white
         self.fifty_move_rule = 0
+        # Starts at 1 and goes up after each black move, as in FEN.
+        self.fullmove_number = 1
 
     def new_game(self):
         """Sets the board to a new game."""
-        self.board.board = [None for x in range(0, 64)]
-        self.board.pieces = []
+        self.board.clear()
         # Pawns
         for pawn_pos in range(0, 8):
             new_white_pawn = Pawn(self.white, [pawn_pos, 6])
@@ -816,6 +1080,19 @@ class Game():
         self.board.add_to_board(black_queen)
         self.board.add_to_board(black_king)
 
+    def load_fen(self, fen):
+        """Sets the board, side to move and move counters from a FEN
+        string. The counters default to 0 and 1 if left out."""
+        self.board = Board.from_fen(fen, self.white, self.black)
+        self.current_turn = (self.white, self.black)[self.board.turn]
+        fields = fen.split()
+        self.fifty_move_rule = int(fields[4]) if len(fields) > 4 else 0
+        self.fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+
+    def to_fen(self):
+        """Returns the FEN string of the game's position."""
+        return self.board.to_fen(self.fifty_move_rule, self.fullmove_number)
+
     def change_turn(self):
         """Switches the turn."""
         if self.current_turn == self.white:
@@ -826,21 +1103,34 @@ class Game():
     def make_random_move(self):
         """Fetches the current players list of possible moves,
         and then chooses and executes one at random."""
-        moves_list = self.board.get_all_legal_moves(self.current_turn)
-        tup = random.choice(moves_list)
-        self.make_move(tup[0], tup[1])
-
-    def make_move(self, piece, to_position):
-        """Make a move. Error if the piece does not belong to
+        moves_list = self.board.get_all_legal_moves(self.current_turn, True)
+        self.make_move(random.choice(moves_list))
+
+    def make_book_move(self, book, rng=random):
+        """Plays a move from the opening book (a book.OpeningBook), picked
+        by weight. Returns the move, or None if the position is out of
+        book and nothing was played."""
+        move = book.choose(self.board, rng)
+        if move is not None:
+            self.make_move(move)
+        return move
+
+    def make_move(self, move, to_position=None):
+        """Make a move, either packed or given as a piece and the position
+        it moves to. Error if the piece does not belong to
         the owner of that piece. Handles captures."""
+        if to_position is not None:
+            move = self.board.pack_move(move, to_position)
+        piece = self.board.board[move & 63]
         if piece.owner != self.current_turn:
             raise Exception
-        if (isinstance(piece, Pawn) or
-                self.board.get_piece_at_position(to_position)):
+        if piece.kind == PAWN or move & CAPTURE:
             self.fifty_move_rule = 0
         else:
             self.fifty_move_rule += 1
-        self.board.make_move(piece, to_position)
+        if self.current_turn == self.black:
+            self.fullmove_number += 1
+        self.board.make_move(move)
         self.change_turn()
 
     def checkmate(self):
@@ -882,3 +1172,17 @@ class Game():
             return True
 
         return False
+
+    def adjudicate(self, bitbases):
+        """Looks the position up in the endgame bitbases (a
+        bitbase.Bitbases). Returns the player who wins with best play,
+        True if the position is a draw, or None if the bitbases do not
+        cover it."""
+        result = bitbases.probe(self.board)
+        if result is None:
+            return None
+        if result == 0:
+            return True
+        if result > 0:
+            return self.current_turn
+        return self.black if self.current_turn == self.white else self.white
@@ -0,0 +1,156 @@
+"""Static evaluation of a Board, in centipawns from the point of view of
+the side to move.
+
+Each piece is worth its material value plus a piece-square bonus, with
+one set of tables for the middlegame and one for the endgame. The board
+keeps running white minus black totals of both (mg_score and eg_score)
+and the game phase, updating them as pieces are placed and lifted, so
+evaluating a position is a blend of two numbers rather than a walk over
+the pieces."""
+# local imports
+from bitboard import bits
+
+# Piece values, indexed by piece type. The king is never traded. Used
+# for exchanges and move ordering.
+PIECE_VALUES = [100, 320, 330, 500, 900, 0]
+
+MG_VALUES = [100, 320, 330, 500, 900, 0]
+EG_VALUES = [120, 300, 320, 520, 920, 0]
+
+# How much each piece type counts towards the middlegame. All the pieces
+# of the start position add up to MAX_PHASE; positions with less are
+# blended towards the endgame tables.
+PHASE_WEIGHTS = [0, 1, 1, 2, 4, 0]
+MAX_PHASE = 24
+
+# ------------ Piece-Square Tables -------------
+# From white's point of view, a8 first and h1 last, the same as the board
+# squares. Black uses the square flipped top to bottom (square ^ 56).
+
+PAWN_MG = [
+    0,   0,   0,   0,   0,   0,   0,   0,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    10,  10,  20,  30,  30,  20,  10,  10,
+    5,   5,  10,  25,  25,  10,   5,   5,
+    0,   0,   0,  20,  20,   0,   0,   0,
+    5,  -5, -10,   0,   0, -10,  -5,   5,
+    5,  10,  10, -20, -20,  10,  10,   5,
+    0,   0,   0,   0,   0,   0,   0,   0]
+
+# Passed or not, a pawn near promotion is worth a lot more in the endgame.
+PAWN_EG = [
+    0,   0,   0,   0,   0,   0,   0,   0,
+    80,  80,  80,  80,  80,  80,  80,  80,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    30,  30,  30,  30,  30,  30,  30,  30,
+    15,  15,  15,  15,  15,  15,  15,  15,
+    5,   5,   5,   5,   5,   5,   5,   5,
+    0,   0,   0,   0,   0,   0,   0,   0,
+    0,   0,   0,   0,   0,   0,   0,   0]
+
+KNIGHT = [
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20,   0,   0,   0,   0, -20, -40,
+    -30,   0,  10,  15,  15,  10,   0, -30,
+    -30,   5,  15,  20,  20,  15,   5, -30,
+    -30,   0,  15,  20,  20,  15,   0, -30,
+    -30,   5,  10,  15,  15,  10,   5, -30,
+    -40, -20,   0,   5,   5,   0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50]
+
+BISHOP = [
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,  10,  10,   5,   0, -10,
+    -10,   5,   5,  10,  10,   5,   5, -10,
+    -10,   0,  10,  10,  10,  10,   0, -10,
+    -10,  10,  10,  10,  10,  10,  10, -10,
+    -10,   5,   0,   0,   0,   0,   5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20]
+
+ROOK = [
+    0,   0,   0,   0,   0,   0,   0,   0,
+    5,  10,  10,  10,  10,  10,  10,   5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    0,   0,   0,   5,   5,   0,   0,   0]
+
+QUEEN = [
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,   5,   5,   5,   0, -10,
+    -5,   0,   5,   5,   5,   5,   0,  -5,
+    0,   0,   5,   5,   5,   5,   0,  -5,
+    -10,   5,   5,   5,   5,   5,   0, -10,
+    -10,   0,   5,   0,   0,   0,   0, -10,
+    -20, -10, -10,  -5,  -5, -10, -10, -20]
+
+# The king hides behind its pawns in the middlegame and heads for the
+# centre in the endgame.
+KING_MG = [
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+    20,  20,   0,   0,   0,   0,  20,  20,
+    20,  30,  10,   0,   0,  10,  30,  20]
+
+KING_EG = [
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10,   0,   0, -10, -20, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -30,   0,   0,   0,   0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50]
+
+
+def _score_tables(values, tables):
+    """Combines the material values and piece-square tables into
+    tables[color][kind][square], negated for black, so a board can add a
+    piece's entry to its white minus black total."""
+    white = [[value + bonus for bonus in table]
+             for value, table in zip(values, tables)]
+    black = [[-scores[square ^ 56] for square in range(64)]
+             for scores in white]
+    return [white, black]
+
+
+MG_TABLES = _score_tables(MG_VALUES,
+                          [PAWN_MG, KNIGHT, BISHOP, ROOK, QUEEN, KING_MG])
+EG_TABLES = _score_tables(EG_VALUES,
+                          [PAWN_EG, KNIGHT, BISHOP, ROOK, QUEEN, KING_EG])
+
+# ------------ Evaluation -------------
+
+
+def taper(mg_score, eg_score, phase):
+    """Blends the middlegame and endgame scores by the phase."""
+    phase = min(phase, MAX_PHASE)
+    return (mg_score * phase + eg_score * (MAX_PHASE - phase)) // MAX_PHASE
+
+
+def evaluate(board):
+    """Returns the score for the side to move, from the board's running
+    totals."""
+    score = taper(board.mg_score, board.eg_score, board.phase)
+    return -score if board.turn else score
+
+
+def compute_scores(board):
+    """Works out the running totals from scratch, as (mg_score,
+    eg_score, phase). Used to check the incrementally updated ones."""
+    mg_score = eg_score = phase = 0
+    for color in range(2):
+        for kind in range(6):
+            for square in bits(board.bitboards[color][kind]):
+                mg_score += MG_TABLES[color][kind][square]
+                eg_score += EG_TABLES[color][kind][square]
+                phase += PHASE_WEIGHTS[kind]
+    return mg_score, eg_score, phase
@@ -0,0 +1,64 @@
+"""Input features for training, a batch of positions at a time.
+
+Each position becomes PLANES planes of 8x8, indexed [plane][y][x] like
+the board squares (rank 8 first):
+
+    0-5     white pawns, knights, bishops, rooks, queens and king
+    6-11    the same for black
+    12      all ones with white to move
+    13-16   all ones for each castling right held: K, Q, k and q
+    17      the en passant target square, as in FEN
+
+A batch is encoded from the positions' snapshots with whole array
+operations: the bitboards are unpacked into planes in one go, rather
+than looking at squares one at a time.
+
+NumPy is only needed here, and only once a batch is encoded."""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PIECE_PLANES = 12
+TURN_PLANE = 12
+CASTLING_PLANE = 13
+EN_PASSANT_PLANE = 17
+PLANES = 18
+
+
+def encode_snapshots(snapshots, dtype=None):
+    """Returns the features of the positions of the snapshots (see
+    Board.snapshot) as an array of shape (len(snapshots), PLANES, 8, 8),
+    of float32 unless another dtype is given."""
+    if np is None:
+        raise ImportError("encoding features needs numpy")
+    count = len(snapshots)
+    planes = np.zeros((count, PLANES, 8, 8),
+                      dtype=np.float32 if dtype is None else dtype)
+    if not count:
+        return planes
+    bitboards = np.array([snapshot[:PIECE_PLANES] for snapshot in snapshots],
+                         dtype="<u8")
+    en_passant, castling, turn = np.array(
+        [snapshot[PIECE_PLANES:] for snapshot in snapshots],
+        dtype=np.int64).T
+    # Bit n of a bitboard is square n, so unpacking the little endian bytes
+    # least significant bit first lays the squares out a8 to h1.
+    planes[:, :PIECE_PLANES] = np.unpackbits(
+        bitboards.view(np.uint8).reshape(count, PIECE_PLANES, 8),
+        axis=2, bitorder="little").reshape(count, PIECE_PLANES, 8, 8)
+    planes[:, TURN_PLANE] = (turn == 0)[:, None, None]
+    rights = castling[:, None] >> np.arange(4) & 1
+    planes[:, CASTLING_PLANE:EN_PASSANT_PLANE] = rights[:, :, None, None]
+    # The target square is behind the pawn that made the double push,
+    # which belongs to the side not to move.
+    rows = np.flatnonzero(en_passant >= 0)
+    targets = en_passant[rows] + np.where(turn[rows], 8, -8)
+    planes[rows, EN_PASSANT_PLANE, targets >> 3, targets & 7] = 1
+    return planes
+
+
+def encode_boards(boards, dtype=None):
+    """Returns the features of the boards' positions, as
+    encode_snapshots."""
+    return encode_snapshots([board.snapshot() for board in boards], dtype)
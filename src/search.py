@@ -0,0 +1,552 @@
+"""Negamax alpha-beta search over a Board. Moves are made and taken back
+on the one board with make_move and unmake_move, nothing is copied."""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing.shared_memory import SharedMemory
+import os
+import random
+from time import monotonic
+
+from bitboard import PAWN, KING
+from engine import CAPTURE, EN_PASSANT, Board, Player, Color
+from evaluation import evaluate, PIECE_VALUES
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+# ------------ Constants -------------
+
+INFINITY = 32000
+# Mate scores are MATE less the plies to the mate, so faster mates score
+# higher. Anything beyond MATE_BOUND is a mate score.
+MATE = 30000
+MAX_PLY = 128
+MATE_BOUND = MATE - MAX_PLY
+# A position the bitbases have as won scores KNOWN_WIN plus the static
+# evaluation, below any mate but above any material.
+KNOWN_WIN = 20000
+# Per square the winning king is closer to the losing one, in such wins.
+KING_DISTANCE_BONUS = 10
+
+# Move ordering scores. The hash move goes first, then captures by most
+# valuable victim and least valuable attacker (piece types are in value
+# order), promotions, the killer moves and the rest by history.
+HASH_MOVE_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 29
+PROMOTION_SCORE = 1 << 28
+KILLER_SCORE = 1 << 27
+
+# Quiescence skips captures that could not lift the score to alpha even
+# with this much to spare.
+DELTA_MARGIN = 200
+# Piece values for exchanges. A king can only take last, so it is worth
+# more than anything it could win.
+SEE_VALUES = PIECE_VALUES[:KING] + [20000]
+
+# The clock and stop flag are looked at once every this many nodes.
+CHECK_INTERVAL = 1024
+# With a clock, a move gets about 1/MOVES_TO_GO of the time left plus most
+# of the increment. No new iteration starts past that, and an iteration
+# is cut off at HARD_LIMIT_FACTOR times that, never using more than
+# MAX_CLOCK_SHARE of the clock.
+MOVES_TO_GO = 30
+HARD_LIMIT_FACTOR = 4
+MAX_CLOCK_SHARE = 0.25
+
+SearchResult = namedtuple("SearchResult", "move score pv depth nodes")
+
+
+class _Stop(Exception):
+    """Raised inside the search when its budget runs out."""
+
+
+def score_to_table(score, ply):
+    """Mate scores are stored relative to the position, not the root."""
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    """Turns a stored mate score back into one relative to the root."""
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+
+def see(board, move):
+    """Static exchange evaluation. Returns the material the side to move
+    wins with the capture (or promotion), if both sides then keep taking
+    back on the square with their least valuable piece for as long as it
+    pays. Works on the bitboards alone, no moves are made. Sliders behind
+    a piece that takes join in as the occupancy is cleared."""
+    from_square = move & 63
+    to_square = move >> 6 & 63
+    occupancy = board.occupancy ^ (1 << from_square)
+    if move & EN_PASSANT:
+        gains = [SEE_VALUES[PAWN]]
+        # The pawn taken stands beside the pawn taking it.
+        occupancy ^= 1 << (to_square + (8, -8)[board.turn])
+    elif move & CAPTURE:
+        gains = [SEE_VALUES[board.board[to_square].kind]]
+    else:
+        # A promotion onto an empty square.
+        gains = [0]
+    attacker = board.board[from_square].kind
+    promotion = move >> 12 & 7
+    if promotion:
+        gains[0] += SEE_VALUES[promotion] - SEE_VALUES[PAWN]
+        attacker = promotion
+    side = 1 - board.turn
+    while True:
+        attackers = board.attackers_to(to_square, side, occupancy) & occupancy
+        if not attackers:
+            break
+        for kind in range(6):
+            pieces = attackers & board.bitboards[side][kind]
+            if pieces:
+                break
+        # The piece standing on the square is taken next.
+        gains += SEE_VALUES[attacker] - gains[-1],
+        if max(-gains[-2], gains[-1]) < 0:
+            # Taking back cannot change the outcome any more.
+            gains.pop()
+            break
+        occupancy ^= pieces & -pieces
+        attacker = kind
+        side = 1 - side
+    for index in range(len(gains) - 1, 0, -1):
+        gains[index - 1] = -max(-gains[index - 1], gains[index])
+    return gains[0]
+
+
+class Search:
+    """Searches the board's position for the side to move (board.turn).
+    Results are kept in the transposition table between searches. With
+    bitbases (a bitbase.Bitbases) the search stops at the positions they
+    cover."""
+    def __init__(self, board, table=None, bitbases=None):
+        self.board = board
+        self.table = TranspositionTable() if table is None else table
+        self.bitbases = bitbases
+        # Whether positions the bitbases cover end the search; see search.
+        self.probing = False
+        # The root moves searched, when only some of them are.
+        self.root_moves = None
+        self.nodes = 0
+        self.node_limit = None
+        # The node count at which the limits are next checked.
+        self.next_check = 0
+        # monotonic() time past which the search stops, or None.
+        self.deadline = None
+        # An object with is_set(), like threading.Event, that stops the
+        # search from outside when set.
+        self.stop = None
+        # pv[ply] is the best line found from ply on.
+        self.pv = [[] for ply in range(MAX_PLY + 1)]
+        # Two quiet moves per ply that last caused a cutoff.
+        self.killers = [[0, 0] for ply in range(MAX_PLY + 1)]
+        # history[color][from | to << 6], how often a quiet move cut off,
+        # weighted by depth.
+        self.history = [[0] * 4096, [0] * 4096]
+        # Beta cutoffs, and those on the first move tried. Their ratio
+        # measures how good the move ordering is.
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def search(self, depth=MAX_PLY, nodes=None, movetime=None, clock=None,
+               increment=0, stop=None):
+        """Searches one ply deeper at a time until one of the limits is
+        reached: depth plies, about nodes positions visited, movetime
+        seconds, a share of the side to move's clock (seconds left, plus
+        increment seconds a move) worked out by allot_time, or the stop
+        flag (anything with is_set) being set.
+
+        Returns a SearchResult from the last iteration that finished: the
+        best move, its score, the principal variation, the depth reached
+        and the node count. The move is None if there are no legal
+        moves."""
+        board = self.board
+        start = monotonic()
+        self.nodes = 0
+        self.node_limit = nodes
+        self.next_check = 0
+        self.stop = stop
+        # A movetime is used in full, a clock is managed.
+        soft_limit = None
+        hard_limit = movetime
+        if clock is not None:
+            soft_limit, clock_limit = self.allot_time(clock, increment)
+            hard_limit = (clock_limit if hard_limit is None else
+                          min(hard_limit, clock_limit))
+        self.deadline = None if hard_limit is None else start + hard_limit
+        self.cutoffs = self.first_move_cutoffs = 0
+        self.killers = [[0, 0] for ply in range(MAX_PLY + 1)]
+        for history in self.history:
+            for index in range(4096):
+                history[index] >>= 1
+        self.table.new_search()
+        stack_size = len(board.move_stack)
+        moves = board.generate_moves(board.turn)
+        self.probing = False
+        self.root_moves = None
+        if self.bitbases is not None:
+            # Searched from a position the bitbases cover, the search can
+            # only tell the moves that keep a win (or the draw) from the
+            # rest. Those are kept and the search finds the way forward
+            # among them. Otherwise every position reached that they
+            # cover is scored from them.
+            result = self.bitbases.probe(board)
+            if result is None:
+                self.probing = True
+            elif moves:
+                moves = self.root_moves = self.keeping_result(moves, result)
+        # Something to play even if the first iteration runs out.
+        result = SearchResult(moves[0] if moves else None, 0,
+                              moves[:1], 0, 0)
+        for iteration in range(1, min(depth, MAX_PLY) + 1):
+            try:
+                score = self.negamax(iteration, -INFINITY, INFINITY, 0)
+            except _Stop:
+                # Unwind the moves the interrupted iteration had made.
+                while len(board.move_stack) > stack_size:
+                    board.unmake_move()
+                break
+            pv = list(self.pv[0])
+            result = SearchResult(pv[0] if pv else result.move, score, pv,
+                                  iteration, self.nodes)
+            if not moves or abs(score) > MATE_BOUND:
+                break
+            # The next iteration takes several times as long as this one,
+            # so do not start one that has little chance to finish.
+            if (soft_limit is not None and
+                    monotonic() - start >= soft_limit / 2):
+                break
+        return result._replace(nodes=self.nodes)
+
+    def allot_time(self, clock, increment):
+        """Returns the time to aim for and the most time to spend on a move,
+        in seconds, given the clock time left and the increment."""
+        target = clock / MOVES_TO_GO + increment * 3 / 4
+        most = min(target * HARD_LIMIT_FACTOR, clock * MAX_CLOCK_SHARE)
+        return min(target, most), most
+
+    def check_limits(self):
+        """Called every CHECK_INTERVAL nodes and when the node limit is
+        reached. Raises _Stop if a limit has run out."""
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            raise _Stop
+        if self.stop is not None and self.stop.is_set():
+            raise _Stop
+        if self.deadline is not None and monotonic() >= self.deadline:
+            raise _Stop
+        self.next_check = self.nodes + CHECK_INTERVAL
+        if self.node_limit is not None:
+            self.next_check = min(self.next_check, self.node_limit + 1)
+
+    @property
+    def cutoff_rate(self):
+        """The share of beta cutoffs that came from the first move tried."""
+        if not self.cutoffs:
+            return 0.0
+        return self.first_move_cutoffs / self.cutoffs
+
+    def order_moves(self, moves, ply, hash_move):
+        """Returns the moves best first, to get alpha beta cutoffs early."""
+        squares = self.board.board
+        killers = self.killers[ply]
+        history = self.history[self.board.turn]
+        scored = []
+        for move in moves:
+            if move == hash_move:
+                score = HASH_MOVE_SCORE
+            elif move & CAPTURE:
+                if move & EN_PASSANT:
+                    victim = 0  # a pawn
+                else:
+                    victim = squares[move >> 6 & 63].kind
+                score = (CAPTURE_SCORE + victim * 8 -
+                         squares[move & 63].kind + (move >> 12 & 7))
+            elif move >> 12 & 7:
+                score = PROMOTION_SCORE + (move >> 12 & 7)
+            elif move == killers[0]:
+                score = KILLER_SCORE + 1
+            elif move == killers[1]:
+                score = KILLER_SCORE
+            else:
+                score = history[move & 4095]
+            scored += (score, move),
+        scored.sort(reverse=True)
+        return [move for score, move in scored]
+
+    def negamax(self, depth, alpha, beta, ply):
+        """Returns the score of the position for the side to move, searched
+        depth plies deep within the alpha beta window."""
+        self.pv[ply] = []
+        if depth <= 0 or ply >= MAX_PLY:
+            return self.quiesce(alpha, beta, ply)
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self.check_limits()
+        board = self.board
+
+        key = board.hash
+        entry = self.table.probe(key)
+        hash_move = 0 if entry is None else entry[0]
+        if entry is not None and ply > 0 and entry[1] >= depth:
+            score = score_from_table(entry[3], ply)
+            bound = entry[2]
+            if (bound == EXACT or bound == LOWER and score >= beta or
+                    bound == UPPER and score <= alpha):
+                return score
+
+        moves = board.generate_moves(board.turn)
+        if not moves:
+            # Checkmate or stalemate.
+            king = board.king_squares[board.turn]
+            if king is not None and board.is_square_attacked(
+                    king, 1 - board.turn, board.occupancy):
+                return -MATE + ply
+            return 0
+        if ply == 0 and self.root_moves is not None:
+            moves = self.root_moves
+        elif self.probing and ply > 0:
+            score = self.bitbase_score()
+            if score is not None:
+                return score
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = 0
+        for index, move in enumerate(self.order_moves(moves, ply,
+                                                      hash_move)):
+            board.make_move(move)
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            board.unmake_move()
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    self.pv[ply] = [move] + self.pv[ply + 1]
+                    if alpha >= beta:
+                        self.cutoff(move, depth, ply, index)
+                        break
+
+        if best_score >= beta:
+            bound = LOWER
+        elif best_score > original_alpha:
+            bound = EXACT
+        else:
+            bound = UPPER
+        self.table.store(key, best_move, depth, bound,
+                         score_to_table(best_score, ply))
+        return best_score
+
+    def keeping_result(self, moves, result):
+        """Returns the moves after which the bitbases still give the
+        result (1 a win, 0 a draw) to the side to move."""
+        board = self.board
+        kept = []
+        for move in moves:
+            board.make_move(move)
+            if self.bitbases.probe(board) == -result:
+                kept += move,
+            board.unmake_move()
+        return kept or moves
+
+    def bitbase_score(self):
+        """Returns the score of the position from the bitbases, or None if
+        they do not cover it. Wins keep the static evaluation on top, and
+        a bonus for the kings standing close, so the search still heads
+        for the mate rather than marking time."""
+        board = self.board
+        result = self.bitbases.probe(board)
+        if not result:
+            return result
+        winner = board.turn if result > 0 else 1 - board.turn
+        strong = board.king_squares[winner]
+        weak = board.king_squares[1 - winner]
+        distance = max(abs((strong & 7) - (weak & 7)),
+                       abs((strong >> 3) - (weak >> 3)))
+        return (result * (KNOWN_WIN + KING_DISTANCE_BONUS * (7 - distance)) +
+                evaluate(board))
+
+    def quiesce(self, alpha, beta, ply):
+        """Searches captures and promotions only, until the position is
+        quiet, so the search does not stop in the middle of an exchange.
+        The side to move may stand pat on the static evaluation instead.
+        Captures that cannot reach alpha (delta pruning) or that lose
+        material in the exchange (SEE) are skipped.
+
+        In check there is no standing pat: every evasion is searched, and
+        a position without one is mate."""
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self.check_limits()
+        board = self.board
+        if self.bitbases is not None:
+            score = self.bitbase_score()
+            if score is not None:
+                return score
+        if ply >= MAX_PLY:
+            return evaluate(board)
+        king = board.king_squares[board.turn]
+        if king is not None and board.attackers_to(king, 1 - board.turn,
+                                                   board.occupancy):
+            moves = board.generate_moves(board.turn)
+            if not moves:
+                return -MATE + ply
+            best_score = -INFINITY
+            for move in self.order_moves(moves, ply, 0):
+                board.make_move(move)
+                score = -self.quiesce(-beta, -alpha, ply + 1)
+                board.unmake_move()
+                if score > best_score:
+                    best_score = score
+                    if score > alpha:
+                        alpha = score
+                        if alpha >= beta:
+                            break
+            return best_score
+
+        stand_pat = evaluate(board)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+        squares = board.board
+        moves = [move for move in board.generate_moves(board.turn)
+                 if move & (CAPTURE | 0x7000)]
+        best_score = stand_pat
+        for move in self.order_moves(moves, ply, 0):
+            promotion = move >> 12 & 7
+            if move & EN_PASSANT:
+                gain = PIECE_VALUES[PAWN]
+            elif move & CAPTURE:
+                gain = PIECE_VALUES[squares[move >> 6 & 63].kind]
+            else:
+                gain = 0
+            if promotion:
+                gain += PIECE_VALUES[promotion] - PIECE_VALUES[PAWN]
+            if stand_pat + gain + DELTA_MARGIN <= alpha:
+                continue
+            if see(board, move) < 0:
+                continue
+            board.make_move(move)
+            score = -self.quiesce(-beta, -alpha, ply + 1)
+            board.unmake_move()
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return best_score
+
+    def cutoff(self, move, depth, ply, index):
+        """Records a beta cutoff by the move, the index-th one tried. Quiet
+        moves become killers and gain history."""
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+        if move & CAPTURE or move >> 12 & 7:
+            return
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history[self.board.turn][move & 4095] += depth * depth
+
+
+# ------------ Parallel Search -------------
+# Lazy SMP: every worker process searches the same root, sharing one
+# transposition table in shared memory. The workers get in each other's
+# way just enough, through the table, to split up the tree. Helpers search
+# a ply deeper every other worker and start with jittered history, so
+# they do not all follow the same move order.
+
+
+class SharedFlag:
+    """A stop flag in the first byte of a shared memory buffer, usable as
+    the stop of Search.search from any process."""
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def is_set(self):
+        """Returns True once the flag has been set."""
+        return self.buffer[0] != 0
+
+    def set(self):
+        """Sets the flag."""
+        self.buffer[0] = 1
+
+
+def _search_worker(snapshot, table_name, flag_name, index, limits):
+    """Runs in a worker process. Rebuilds the position from its snapshot
+    and searches it with the shared table until a limit or the shared
+    stop flag ends the search."""
+    table_memory = SharedMemory(table_name)
+    flag_memory = SharedMemory(flag_name)
+    try:
+        table = TranspositionTable(buffer=table_memory.buf)
+        # The table has to let go of the buffer before the memory can be
+        # closed, whether or not the search gets through.
+        try:
+            board = Board.from_snapshot(snapshot, Player(Color.W),
+                                        Player(Color.B))
+            search = Search(board, table)
+            limits = dict(limits)
+            if index:
+                jitter = random.Random(index)
+                for history in search.history:
+                    for move in range(4096):
+                        history[move] = jitter.randrange(16)
+                limits["depth"] = (limits.get("depth", MAX_PLY - 1) +
+                                   (index & 1))
+            return search.search(stop=SharedFlag(flag_memory.buf),
+                                 **limits)
+        finally:
+            table.release()
+    finally:
+        table_memory.close()
+        flag_memory.close()
+
+
+def parallel_search(board, workers=None, megabytes=16, stop=None,
+                    **limits):
+    """Searches the board's position with workers processes (one per core
+    by default) sharing a megabytes transposition table. The limits are
+    those of Search.search and apply to the first worker; once it is done
+    the helpers are stopped. stop is checked by this process and passed on
+    to the workers. Returns the result that reached the greatest depth,
+    the first worker's on a tie, with the nodes of all the workers."""
+    workers = workers or os.cpu_count() or 1
+    table_memory = SharedMemory(create=True, size=megabytes << 20)
+    flag_memory = SharedMemory(create=True, size=1)
+    try:
+        flag = SharedFlag(flag_memory.buf)
+        snapshot = board.snapshot()
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(_search_worker, snapshot,
+                                   table_memory.name, flag_memory.name,
+                                   index, limits)
+                       for index in range(workers)]
+            while not futures[0].done():
+                wait(futures[:1], timeout=0.01)
+                if stop is not None and stop.is_set():
+                    flag.set()
+            flag.set()
+            results = [future.result() for future in futures]
+    finally:
+        table_memory.close()
+        table_memory.unlink()
+        flag_memory.close()
+        flag_memory.unlink()
+    best = results[0]
+    for result in results[1:]:
+        if result.depth > best.depth:
+            best = result
+    return best._replace(nodes=sum(result.nodes for result in results))
@@ -0,0 +1,147 @@
+"""Batches of self-play games, for Monte-Carlo statistics.
+
+Games are played on a bare Board with packed moves: each ply generates
+the legal moves once, and that one list decides both the move played and
+whether the game is over. Every game gets its own random generator,
+seeded from the batch seed and the game's number, so a batch plays out
+the same whatever the number of worker processes."""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import random
+import sys
+from time import time
+
+from bitboard import PAWN, KNIGHT, BISHOP, popcount
+from engine import Board, Player, Color, CAPTURE
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+# Games still going after this many plies are scored as draws.
+MAX_PLIES = 1000
+# Games sent to a worker at a time.
+CHUNK_SIZE = 32
+
+Playout = namedtuple("Playout", "outcome length fen")
+Playout.__doc__ = """A finished game: its outcome ("1-0", "0-1" or
+"1/2-1/2"), the number of plies played and the final position's FEN."""
+
+
+def random_policy(board, moves, rng):
+    """Picks one of the moves uniformly at random."""
+    return moves[rng.randrange(len(moves))]
+
+
+def insufficient_material(board):
+    """Returns True if neither side can mate: bare kings, or a single
+    knight or bishop left on the board."""
+    occupancy = board.occupancy
+    if popcount(occupancy) > 3:
+        return False
+    minors = 0
+    for bitboards in board.bitboards:
+        minors |= bitboards[KNIGHT] | bitboards[BISHOP]
+    # Everything other than the kings is a minor piece.
+    return popcount(occupancy) - 2 == popcount(minors)
+
+
+def playout(board, rng, policy=random_policy, max_plies=MAX_PLIES,
+            halfmove_clock=0, fullmove_number=1):
+    """Plays the board's game to the end, choosing moves with
+    policy(board, moves, rng), and returns a Playout. The game ends in
+    checkmate, stalemate, the fifty move rule, threefold repetition,
+    insufficient material or after max_plies."""
+    # Positions seen since the last capture or pawn move, by hash.
+    seen = {board.hash: 1}
+    squares = board.board
+    start_turn = board.turn
+    plies = 0
+    outcome = "1/2-1/2"
+    while plies < max_plies:
+        moves = board.generate_moves(board.turn)
+        if not moves:
+            king = board.king_squares[board.turn]
+            if board.is_square_attacked(king, 1 - board.turn,
+                                        board.occupancy):
+                outcome = ("0-1", "1-0")[board.turn]
+            break
+        if halfmove_clock >= 100 or insufficient_material(board):
+            break
+        move = policy(board, moves, rng)
+        if move & CAPTURE or squares[move & 63].kind == PAWN:
+            halfmove_clock = 0
+            seen.clear()
+        else:
+            halfmove_clock += 1
+        board.make_move(move)
+        plies += 1
+        repeats = seen.get(board.hash, 0) + 1
+        if repeats == 3:
+            break
+        seen[board.hash] = repeats
+    # The fullmove number goes up after every black move.
+    fullmove_number += (plies + start_turn) // 2
+    return Playout(outcome, plies,
+                   board.to_fen(halfmove_clock, fullmove_number))
+
+
+def _play_chunk(fen, seed, first, count, policy, max_plies):
+    """Runs in a pool worker. Plays games first to first + count of the
+    batch from the FEN position and returns their Playouts."""
+    fields = fen.split()
+    halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+    fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+    snapshot = Board.from_fen(fen, Player(Color.W),
+                              Player(Color.B)).snapshot()
+    results = []
+    for index in range(first, first + count):
+        board = Board.from_snapshot(snapshot, Player(Color.W),
+                                    Player(Color.B))
+        rng = random.Random(str(seed) + ":" + str(index))
+        results += playout(board, rng, policy, max_plies, halfmove_clock,
+                           fullmove_number),
+    return results
+
+
+def play_games(games, seed=0, workers=None, fen=START_FEN,
+               policy=random_policy, max_plies=MAX_PLIES,
+               chunk_size=CHUNK_SIZE):
+    """Plays games games from the FEN position across a pool of worker
+    processes (one per core by default) and yields their Playouts, in
+    game order, as the workers finish them. The policy must be a module
+    level function so it can be sent to the workers. With workers set to
+    1 the games are played in this process instead."""
+    chunks = [(first, min(chunk_size, games - first))
+              for first in range(0, games, chunk_size)]
+    if workers == 1:
+        for first, count in chunks:
+            yield from _play_chunk(fen, seed, first, count, policy,
+                                   max_plies)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(_play_chunk, fen, seed, first, count, policy,
+                               max_plies)
+                   for first, count in chunks]
+        for future in futures:
+            yield from future.result()
+
+
+def run_games(games, seed=0, workers=None):
+    """play_games wrapped in a timer. Prints the outcome counts, the
+    average game length and games per second, and returns the counts."""
+    start = time()
+    outcomes = {"1-0": 0, "0-1": 0, "1/2-1/2": 0}
+    plies = 0
+    for result in play_games(games, seed, workers):
+        outcomes[result.outcome] += 1
+        plies += result.length
+    seconds = time() - start
+    for outcome, count in outcomes.items():
+        print(outcome + ": " + str(count))
+    print("Average length: " + str(plies / max(games, 1)))
+    print("Games per second: " + str(games / seconds if seconds else 0))
+    return outcomes
+
+
+if __name__ == "__main__":
+    # python selfplay.py [games [seed]]
+    run_games(int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+              int(sys.argv[2]) if len(sys.argv) > 2 else 0)
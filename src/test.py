@@ -1,9 +1,35 @@
 """Chess engine/AI testing framework using python unittests."""
 # stdlib
+import contextlib
+import io
+import json
+from multiprocessing.shared_memory import SharedMemory
+import os
+import random
+import tempfile
+import threading
+import time
 import unittest
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # local
 from engine import Color, Board, Player, Pawn, Knight, Rook, Bishop, Knight, Queen, King, xy_to_num, fails_bounds_check
+from engine import CAPTURE, CASTLE, EN_PASSANT, DOUBLE_PUSH, Game, move_name
+from search import (Search, MATE, INFINITY, KNOWN_WIN, see, parallel_search,
+                    _search_worker)
+from evaluation import evaluate, compute_scores, MAX_PHASE
+from perft import Perft, PERFT_SUITE, run_suite
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+from bitbase import Bitbases, generate_all
+from features import encode_boards, encode_snapshots, PLANES
+from selfplay import Playout, playout, play_games
+from book import OpeningBook, polyglot_key, polyglot_move, ENTRY
+from bitboard import (PAWN, ROOK, QUEEN, KNIGHT_ATTACKS, KING_ATTACKS, popcount,
+                      rook_attacks, bishop_attacks, queen_attacks)
 
 # ------------ Utility Functions ------------
 
@@ -12,6 +38,15 @@ def create_board_and_players():
     """One line function used to create an empty board and players."""
     return Board(), Player(Color.W), Player(Color.B)
 
+
+def board_state(board):
+    """Returns everything make_move can change, for comparing a board
+    before a move and after it has been unmade."""
+    squares = [(piece, piece and list(piece.position),
+                piece and piece.first_move) for piece in board.board]
+    return (squares, [list(bbs) for bbs in board.bitboards],
+            list(board.occupied), board.en_passant, len(board.pieces))
+
 # ------------ Test Suites ------------
 
 
@@ -50,6 +85,34 @@ class TestEngineUtilityMethods(unittest.TestCase):
         self.assertTrue(fails_bounds_check(pos_inv2))
         self.assertTrue(fails_bounds_check(pos_inv3))
 
+    def test_leaper_attack_tables(self):
+        """Knight and king tables never wrap around the board edges."""
+        # a8 corner
+        self.assertEqual(KNIGHT_ATTACKS[0], 1 << 10 | 1 << 17)  # c7, b6
+        self.assertEqual(KING_ATTACKS[0], 1 << 1 | 1 << 8 | 1 << 9)
+        # h1 corner
+        self.assertEqual(KNIGHT_ATTACKS[63], 1 << 53 | 1 << 46)  # f2, g3
+        self.assertEqual(KING_ATTACKS[63], 1 << 62 | 1 << 55 | 1 << 54)
+        self.assertEqual(popcount(KNIGHT_ATTACKS[xy_to_num([3, 4])]), 8)
+        self.assertEqual(popcount(KING_ATTACKS[xy_to_num([3, 4])]), 8)
+
+    def test_sliding_attack_tables(self):
+        """Rook and bishop lookups stop at (and include) the first blocker
+        on each ray."""
+        d4 = xy_to_num([3, 4])
+        self.assertEqual(popcount(rook_attacks(d4, 0)), 14)
+        self.assertEqual(popcount(bishop_attacks(d4, 0)), 13)
+        self.assertEqual(queen_attacks(d4, 0),
+                         rook_attacks(d4, 0) | bishop_attacks(d4, 0))
+
+        blockers = 1 << xy_to_num([3, 2]) | 1 << xy_to_num([5, 6])  # d6, f2
+        rook = rook_attacks(d4, blockers)
+        self.assertTrue(rook >> xy_to_num([3, 2]) & 1)
+        self.assertFalse(rook >> xy_to_num([3, 1]) & 1)
+        bishop = bishop_attacks(d4, blockers)
+        self.assertTrue(bishop >> xy_to_num([5, 6]) & 1)
+        self.assertFalse(bishop >> xy_to_num([6, 7]) & 1)
+
 
 class TestBoardMethods(unittest.TestCase):
     """Test suite for Board class."""
@@ -69,6 +132,54 @@ class TestBoardMethods(unittest.TestCase):
         # assure that the piece is in the board's pieces list.
         self.assertTrue(pawn_white in board.pieces)
 
+    def test_bitboards(self):
+        """Adding and removing a piece keeps the piece type and occupancy
+        bitboards in sync with the board array."""
+        board, white, black = create_board_and_players()
+        pawn_white = Pawn(white, [4, 6])  # e2
+        rook_black = Rook(black, [0, 0])  # a8
+        board.add_to_board(pawn_white)
+        board.add_to_board(rook_black)
+
+        self.assertEqual(board.bitboards[Color.W.value][PAWN], 1 << 52)
+        self.assertEqual(board.bitboards[Color.B.value][ROOK], 1)
+        self.assertEqual(board.occupancy, 1 << 52 | 1)
+
+        board.remove_from_board([4, 6])
+        self.assertEqual(board.bitboards[Color.W.value][PAWN], 0)
+        self.assertEqual(board.occupied[Color.W.value], 0)
+        self.assertEqual(board.occupancy, 1)
+
+    def test_piece_lists(self):
+        """Piece lists and king squares follow captures, castling and
+        promotion, and are restored by unmake_move."""
+        board, white, black = create_board_and_players()
+        king_white = King(white, [4, 7])  # e1
+        rook_white = Rook(white, [7, 7])  # h1
+        pawn_white = Pawn(white, [3, 1])  # d7
+        knight_black = Knight(black, [2, 0])  # c8
+        for piece in (king_white, rook_white, pawn_white, knight_black):
+            board.add_to_board(piece)
+        self.assertEqual(board.get_pieces(Color.B.value), [knight_black])
+        self.assertEqual(board.king_squares, [60, None])
+
+        board.make_move(king_white, [6, 7])  # castle to g1
+        self.assertEqual(board.king_squares[Color.W.value], 62)
+        board.make_move(pawn_white, [2, "Q"])  # dxc8=Q
+        self.assertEqual(board.get_pieces(Color.B.value), [])
+        self.assertEqual(len(board.piece_lists[Color.W.value][QUEEN]), 1)
+        self.assertFalse(pawn_white in board.pieces)
+
+        board.unmake_move()
+        board.unmake_move()
+        self.assertEqual(board.king_squares[Color.W.value], 60)
+        self.assertEqual(board.get_pieces(Color.B.value), [knight_black])
+        self.assertEqual(len(board.piece_lists[Color.W.value][QUEEN]), 0)
+        self.assertEqual(len(board.pieces), 4)
+
+        board.remove_from_board([4, 7])
+        self.assertEqual(board.king_squares, [None, None])
+
     def test_check_if_empty(self):
         """Make sure check_if_empty returns True at first,
         and then False when we add a piece."""
@@ -165,6 +276,32 @@ class TestBoardMethods(unittest.TestCase):
         board.add_to_board(pawn_black)
         self.assertFalse(board.is_in_check(white))
 
+    def test_determine_check_leapers(self):
+        """Pawn, knight and king attackers are found from the king's
+        square, including a pawn giving check on the last rank."""
+        board, white, black = create_board_and_players()
+        board.add_to_board(King(black, [4, 0]))  # e8
+        pawn_white = Pawn(white, [3, 1])  # d7
+        board.add_to_board(pawn_white)
+        self.assertTrue(board.is_in_check(black))
+
+        board.remove_from_board([3, 1])
+        self.assertFalse(board.is_in_check(black))
+        board.add_to_board(Knight(white, [5, 2]))  # f6
+        self.assertTrue(board.is_in_check(black))
+
+    def test_is_square_attacked_occupancy(self):
+        """Sliders are blocked by the occupancy passed in, not the board's,
+        so a king can be tested with itself lifted off the board."""
+        board, white, black = create_board_and_players()
+        board.add_to_board(Rook(black, [0, 7]))  # a1
+        board.add_to_board(King(white, [3, 7]))  # d1
+        f1 = xy_to_num([5, 7])
+        self.assertFalse(board.is_square_attacked(f1, Color.B.value,
+                                                  board.occupancy))
+        self.assertTrue(board.is_square_attacked(
+            f1, Color.B.value, board.occupancy ^ 1 << xy_to_num([3, 7])))
+
     def test_is_attacked(self):
         """Assure that all positions attacked by an enemy piece return True."""
         board, white, black = create_board_and_players()
@@ -177,6 +314,14 @@ class TestBoardMethods(unittest.TestCase):
         self.assertFalse(board.is_attacked([5, 5], black))
         self.assertFalse(board.is_attacked([4, 7], white))
 
+    def test_is_attacked_by_pawn(self):
+        """Pawns attack their capture diagonals, not the square in front."""
+        board, white, black = create_board_and_players()
+        board.add_to_board(Pawn(white, [4, 6]))  # e2
+        self.assertTrue(board.is_attacked([3, 5], black))  # d3
+        self.assertTrue(board.is_attacked([5, 5], black))  # f3
+        self.assertFalse(board.is_attacked([4, 5], black))  # e3
+
     def test_get_all_legal_moves_simple(self):
         """Simply verify that getting the legal moves of two pieces
         sum to the returned value of get_all_legal_moves."""
@@ -247,6 +392,47 @@ class TestBoardMethods(unittest.TestCase):
 
         self.assertTrue(board.get_all_legal_moves(white) == [])
 
+    def test_get_all_legal_moves_pinned(self):
+        """A pinned piece may only move along the pin."""
+        board, white, black = create_board_and_players()
+        board.add_to_board(King(white, [4, 7]))  # e1
+        rook_white = Rook(white, [4, 4])  # e4
+        board.add_to_board(rook_white)
+        board.add_to_board(Rook(black, [4, 0]))  # e8
+
+        rook_moves = [move for piece, move in board.get_all_legal_moves(white)
+                      if piece is rook_white]
+        self.assertEqual(sorted(rook_moves),
+                         [[4, 0], [4, 1], [4, 2], [4, 3], [4, 5], [4, 6]])
+
+    def test_get_all_legal_moves_evasion(self):
+        """In check, pieces other than the king may only capture the checker
+        or block it."""
+        board, white, black = create_board_and_players()
+        board.add_to_board(King(white, [4, 7]))  # e1
+        bishop_white = Bishop(white, [2, 7])  # c1
+        board.add_to_board(bishop_white)
+        board.add_to_board(Rook(black, [4, 0]))  # e8
+
+        self.assertEqual(bishop_white.get_legal_moves(board, True), [[4, 5]])
+        # Without checks considered the bishop is free to move.
+        self.assertEqual(len(bishop_white.get_legal_moves(board, False)), 7)
+
+    def test_en_passant_discovered_check(self):
+        """En passant is not allowed when removing both pawns from the rank
+        would expose the king."""
+        board, white, black = create_board_and_players()
+        board.add_to_board(King(white, [0, 3]))  # a5
+        pawn_white = Pawn(white, [1, 3])  # b5
+        board.add_to_board(pawn_white)
+        pawn_black = Pawn(black, [2, 1])  # c7
+        board.add_to_board(pawn_black)
+        board.add_to_board(Rook(black, [7, 3]))  # h5
+
+        board.make_move(pawn_black, [2, 3])  # c5
+        self.assertEqual(pawn_white.get_legal_moves(board, True), [[1, 2]])
+        self.assertTrue([2, 2] in pawn_white.get_legal_moves(board, False))
+
     def test_board_with_passed_in_board(self):
         """Tests the creation of a board using a previous
         board's array. Each peice should have a copy created."""
@@ -349,6 +535,176 @@ class TestBoardMethods(unittest.TestCase):
         self.assertTrue(board.get_piece_at_position([4, 7]) is None)
         self.assertTrue(board.get_piece_at_position([7, 7]) is None)
 
+    def test_unmake_move(self):
+        """Every kind of move is taken back exactly by unmake_move."""
+        board, white, black = create_board_and_players()
+        king_white = King(white, [4, 7])  # e1
+        rook_white = Rook(white, [7, 7])  # h1
+        pawn_white = Pawn(white, [3, 1])  # d7
+        pawn_white2 = Pawn(white, [5, 3])  # f5
+        knight_black = Knight(black, [2, 0])  # c8
+        pawn_black = Pawn(black, [4, 1])  # e7
+        for piece in (king_white, rook_white, pawn_white, pawn_white2,
+                      knight_black, pawn_black):
+            board.add_to_board(piece)
+
+        start = board_state(board)
+        for piece, move in ((king_white, [6, 7]),  # castle
+                            (rook_white, [7, 0]),
+                            (pawn_white, [2, "Q"]),  # capture promotion
+                            (pawn_white, [3, "N"])):
+            board.make_move(piece, move)
+            self.assertNotEqual(board_state(board), start)
+            self.assertTrue(board.unmake_move() is piece)
+            self.assertEqual(board_state(board), start)
+
+        # double push followed by an en passant capture, undone in order
+        board.make_move(pawn_black, [4, 3])  # e5
+        after_push = board_state(board)
+        board.make_move(pawn_white2, [4, 2])  # fxe6 e.p.
+        self.assertTrue(board.get_piece_at_position([4, 3]) is None)
+        board.unmake_move()
+        self.assertEqual(board_state(board), after_push)
+        self.assertTrue(board.en_passant is pawn_black)
+        board.unmake_move()
+        self.assertEqual(board_state(board), start)
+        self.assertTrue(board.unmake_move() is None)
+
+    def test_packed_moves(self):
+        """Packed moves carry the right flags and convert to and from the
+        [piece, move_position] form without loss."""
+        board, white, black = create_board_and_players()
+        king_white = King(white, [4, 7])  # e1
+        board.add_to_board(king_white)
+        board.add_to_board(Rook(white, [7, 7]))  # h1
+        board.add_to_board(Pawn(white, [3, 1]))  # d7
+        board.add_to_board(Knight(black, [2, 0]))  # c8
+        pawn_white = Pawn(white, [5, 3])  # f5
+        board.add_to_board(pawn_white)
+        pawn_black = Pawn(black, [4, 1])  # e7
+        board.add_to_board(pawn_black)
+        board.make_move(pawn_black, [4, 3])  # e5, double push
+        self.assertTrue(board.move_stack[-1][0] & DOUBLE_PUSH)
+
+        moves = board.get_all_legal_moves(white, packed=True)
+        self.assertEqual([board.unpack_move(move) for move in moves],
+                         board.get_all_legal_moves(white))
+        for move in moves:
+            self.assertEqual(board.pack_move(*board.unpack_move(move)), move)
+
+        flagged = [board.unpack_move(move)[1] for move in moves
+                   if move & CASTLE]
+        self.assertEqual(flagged, [[6, 7]])
+        flagged = [board.unpack_move(move)[1] for move in moves
+                   if move & EN_PASSANT]
+        self.assertEqual(flagged, [[4, 2]])
+        flagged = [board.unpack_move(move)[1] for move in moves
+                   if move & CAPTURE]
+        self.assertEqual(sorted(flagged, key=str),
+                         [[2, "B"], [2, "N"], [2, "Q"], [2, "R"], [4, 2]])
+
+        board.make_move([move for move in moves if move & CASTLE][0])
+        self.assertTrue(board.get_piece_at_position([6, 7]) is king_white)
+
+    def test_slotted_pieces(self):
+        """Pieces and players have no instance dict, pieces keep their
+        color and square as ints, and board copies share the players."""
+        board, white, black = create_board_and_players()
+        pawn_black = Pawn(black, [2, 1])  # c7
+        board.add_to_board(pawn_black)
+        self.assertFalse(hasattr(pawn_black, "__dict__"))
+        self.assertFalse(hasattr(white, "__dict__"))
+        self.assertEqual((pawn_black.color, pawn_black.square), (1, 10))
+
+        board.make_move(pawn_black, [2, 3])  # c5
+        self.assertEqual(pawn_black.square, 26)
+        self.assertEqual(pawn_black.position, [2, 3])
+
+        new_board = Board(board.board, board.en_passant)
+        copy = new_board.get_piece_at_position([2, 3])
+        self.assertFalse(copy is pawn_black)
+        self.assertTrue(copy.owner is black)
+        self.assertTrue(new_board.en_passant is copy)
+
+    def test_zobrist_hash(self):
+        """The hash is kept up to date by make_move and unmake_move, is the
+        same for transpositions, and covers side to move, castling and
+        capturable en passant."""
+        board, white, black = create_board_and_players()
+        king_white = King(white, [4, 7])  # e1
+        board.add_to_board(king_white)
+        board.add_to_board(Rook(white, [7, 7]))  # h1
+        knight_white = Knight(white, [6, 7])  # g1
+        board.add_to_board(knight_white)
+        board.add_to_board(King(black, [4, 0]))  # e8
+        knight_black = Knight(black, [6, 0])  # g8
+        board.add_to_board(knight_black)
+        pawn_white = Pawn(white, [3, 6])  # d2
+        board.add_to_board(pawn_white)
+        pawn_black = Pawn(black, [4, 4])  # e4
+        board.add_to_board(pawn_black)
+        start = board.hash
+        self.assertEqual(board.castling, 1)
+        self.assertEqual(start, board.compute_hash())
+
+        board.make_move(knight_white, [5, 5])  # Nf3
+        self.assertNotEqual(board.hash, start)
+        board.make_move(knight_black, [5, 2])  # Nf6
+        board.make_move(knight_white, [6, 7])  # Ng1
+        board.make_move(knight_black, [6, 0])  # Ng8
+        self.assertEqual(board.hash, start)
+
+        # Same pieces, but the king has lost its castling rights.
+        board.make_move(king_white, [5, 7])  # Kf1
+        board.make_move(king_white, [4, 7])  # Ke1
+        self.assertNotEqual(board.hash, start)
+        self.assertEqual(board.castling, 0)
+        self.assertEqual(board.hash, board.compute_hash())
+        for move in range(6):
+            board.unmake_move()
+        self.assertEqual(board.hash, start)
+        self.assertEqual(board.castling, 1)
+
+        # The en passant file only counts when it can be taken.
+        board.make_move(pawn_white, [3, 4])  # d4
+        self.assertTrue(board.en_passant is pawn_white)
+        self.assertTrue(board.en_passant_capturable())
+        self.assertEqual(board.hash, board.compute_hash())
+        board.unmake_move()
+        board.remove_from_board([4, 4])
+        board.make_move(pawn_white, [3, 4])  # d4
+        self.assertFalse(board.en_passant_capturable())
+        self.assertEqual(board.hash, board.compute_hash())
+
+    def test_snapshot(self):
+        """A snapshot holds the bitboards, en passant square and castling
+        rights, and rebuilds an equal board."""
+        board, white, black = create_board_and_players()
+        board.add_to_board(King(white, [4, 7]))  # e1
+        board.add_to_board(Rook(white, [7, 7]))  # h1
+        rook_white = Rook(white, [0, 7])  # a1
+        rook_white.first_move = False
+        board.add_to_board(rook_white)
+        board.add_to_board(King(black, [4, 0]))  # e8
+        board.add_to_board(Rook(black, [0, 0]))  # a8
+        pawn_black = Pawn(black, [3, 1])  # d7
+        board.add_to_board(pawn_black)
+        board.make_move(pawn_black, [3, 3])  # d5
+
+        snapshot = board.snapshot()
+        self.assertEqual(len(snapshot), 15)
+        self.assertEqual(snapshot[14], board.turn)
+        self.assertEqual(snapshot[12], 27)
+        self.assertEqual(snapshot[13], 0b1001)
+        self.assertEqual(snapshot[13], board.castling_rights())
+
+        new_board = Board.from_snapshot(snapshot, white, black)
+        self.assertEqual(new_board.snapshot(), snapshot)
+        self.assertEqual(new_board.generate_moves(0),
+                         board.generate_moves(0))
+        self.assertTrue(new_board.get_piece_at_position([0, 0]).owner
+                        is black)
+
     def test_make_move_castle_queenside(self):
         """Ensures queenside castling moving works correctly."""
         board, white = Board(), Player(Color.W)
@@ -366,6 +722,62 @@ class TestBoardMethods(unittest.TestCase):
         self.assertTrue(board.get_piece_at_position([0, 7]) is None)
         self.assertTrue(board.get_piece_at_position([1, 7]) is None)
 
+    def test_fen(self):
+        """Boards load from and write back to FEN, side to move, castling
+        and en passant included."""
+        white, black = Player(Color.W), Player(Color.B)
+        for name, fen, counts in PERFT_SUITE:
+            fields = fen.split()
+            board = Board.from_fen(fen, white, black)
+            self.assertEqual(board.to_fen(int(fields[4]), int(fields[5])),
+                             fen, name)
+            self.assertEqual(len(board.generate_moves(board.turn)),
+                             counts[0], name)
+
+        fen = "4k3/8/8/8/3pP3/8/8/4K2R b K e3 0 1"
+        board = Board.from_fen(fen, white, black)
+        self.assertEqual(board.turn, Color.B.value)
+        self.assertEqual(board.castling, 1)
+        self.assertTrue(board.en_passant is board.board[xy_to_num([4, 4])])
+        self.assertEqual(board.hash, board.compute_hash())
+        self.assertEqual(board.to_fen(), fen)
+
+    def test_fen_leniency(self):
+        """Castling rights without their king or rook are dropped, and
+        missing fields take their defaults."""
+        white, black = Player(Color.W), Player(Color.B)
+        board = Board.from_fen("4k3/8/8/8/8/8/8/4K3 w KQkq - 0 1",
+                               white, black)
+        self.assertEqual(board.castling, 0)
+        self.assertEqual(board.to_fen(), "4k3/8/8/8/8/8/8/4K3 w - - 0 1")
+        board = Board.from_fen("r3k3/8/8/8/8/8/8/R3K1R1 w KQkq - 0 1",
+                               white, black)
+        self.assertEqual(board.castling, 2 | 8)
+        self.assertEqual(board.hash, board.compute_hash())
+        board = Board.from_fen("4k3/8/8/8/8/8/8/4K2R", white, black)
+        self.assertEqual(board.to_fen(), "4k3/8/8/8/8/8/8/4K2R w - - 0 1")
+        board = Board.from_fen("4k3/8/8/8/8/8/8/4K2R b", white, black)
+        self.assertEqual(board.turn, Color.B.value)
+        game = Game()
+        game.load_fen("4k3/8/8/8/8/8/8/4K3 w KQkq - 0 1")
+        self.assertEqual(len(game.board.generate_moves(Color.W.value)), 5)
+
+    def test_game_fen(self):
+        """Games keep the move counters in their FEN."""
+        game = Game()
+        game.new_game()
+        start = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+        self.assertEqual(game.to_fen(), start)
+        game.make_move(game.board.get_piece_at_position([4, 6]), [4, 4])
+        game.make_move(game.board.get_piece_at_position([6, 0]), [5, 2])
+        self.assertEqual(game.to_fen(), "rnbqkb1r/pppppppp/5n2/8/4P3/8/"
+                                        "PPPP1PPP/RNBQKBNR w KQkq - 1 2")
+
+        game.load_fen("8/8/4k3/8/8/8/3K4/8 b - - 37 60")
+        self.assertTrue(game.current_turn is game.black)
+        self.assertEqual(game.fifty_move_rule, 37)
+        self.assertEqual(game.to_fen(), "8/8/4k3/8/8/8/3K4/8 b - - 37 60")
+
 
 class TestPieceMethods(unittest.TestCase):
     """Test suite for Piece class."""
@@ -1049,5 +1461,630 @@ class TestKingMethods(unittest.TestCase):
         self.assertFalse(castle_move in returned_moves)
 
 
+class TestTranspositionTable(unittest.TestCase):
+    """Test suite for the TranspositionTable class."""
+
+    def test_store_and_probe(self):
+        """Entries come back as stored, and the table size is fixed."""
+        table = TranspositionTable(1)
+        self.assertEqual(len(table), 1 << 16)
+        self.assertEqual(table.table.nbytes, 1 << 20)
+        self.assertTrue(table.probe(12345) is None)
+
+        table.store(12345, 0x1234, 5, EXACT, -250)
+        self.assertEqual(table.probe(12345), (0x1234, 5, EXACT, -250))
+        # Same bucket, different key.
+        self.assertTrue(table.probe(12345 + table.buckets) is None)
+
+        # A store without a move keeps the old one.
+        table.store(12345, 0, 6, LOWER, 40000)
+        self.assertEqual(table.probe(12345), (0x1234, 6, LOWER, 32767))
+
+    def test_replacement(self):
+        """Deep entries stay in the depth preferred slot, shallow ones go
+        to the always replace slot."""
+        table = TranspositionTable(1)
+        step = table.buckets
+        table.store(7, 1, 8, EXACT, 0)
+        table.store(7 + step, 2, 3, UPPER, 0)
+        table.store(7 + 2 * step, 3, 2, UPPER, 0)
+        self.assertEqual(table.probe(7)[0], 1)
+        self.assertTrue(table.probe(7 + step) is None)
+        self.assertEqual(table.probe(7 + 2 * step)[0], 3)
+
+        # Entries from an old search give way.
+        table.new_search()
+        table.store(7 + step, 2, 1, UPPER, 0)
+        self.assertTrue(table.probe(7) is None)
+        self.assertEqual(table.probe(7 + step)[0], 2)
+
+    def test_hashfull(self):
+        """hashfull counts entries of the current search in permille."""
+        table = TranspositionTable(1)
+        self.assertEqual(table.hashfull(), 0)
+        for key in range(250):
+            table.store(key, 0, 1, EXACT, 0)
+        self.assertEqual(table.hashfull(), 250)
+        table.new_search()
+        self.assertEqual(table.hashfull(), 0)
+        table.store(3, 0, 1, EXACT, 0)
+        table.clear()
+        self.assertTrue(table.probe(3) is None)
+
+    def test_shared_buffer(self):
+        """Tables over the same buffer see each other's entries."""
+        buffer = bytearray(1 << 16)
+        first = TranspositionTable(buffer=buffer)
+        second = TranspositionTable(buffer=buffer)
+        self.assertEqual(len(first), (1 << 16) // 16)
+        first.store(12345, 77, 4, LOWER, 150)
+        self.assertEqual(second.probe(12345), (77, 4, LOWER, 150))
+        first.release()
+        second.release()
+
+
+class TestPerft(unittest.TestCase):
+    """Test suite for perft and move counting."""
+
+    def test_count_moves(self):
+        """count_moves agrees with generate_moves, promotions, pins and en
+        passant included."""
+        board, white, black = create_board_and_players()
+        board.add_to_board(King(white, [4, 7]))  # e1
+        board.add_to_board(Rook(white, [0, 4]))  # a4
+        board.add_to_board(Pawn(white, [1, 1]))  # b7
+        board.add_to_board(Pawn(white, [6, 6]))  # g2
+        board.add_to_board(King(black, [7, 4]))  # h4
+        pawn_white = Pawn(white, [2, 6])  # c2
+        board.add_to_board(pawn_white)
+        board.add_to_board(Pawn(black, [3, 4]))  # d4
+        board.add_to_board(Knight(black, [0, 0]))  # a8
+        board.make_move(pawn_white, [2, 4])  # c4
+        for color in (Color.W.value, Color.B.value):
+            self.assertEqual(board.count_moves(color),
+                             len(board.generate_moves(color)))
+
+    def test_hashed_perft(self):
+        """Perft counts the known number of nodes from the start, with and
+        without a table."""
+        for megabytes in (0, 1):
+            perft = Perft(megabytes)
+            board, white = perft.game.board, perft.game.white
+            self.assertEqual([perft.perft(board, white, depth)
+                              for depth in range(1, 5)],
+                             [20, 400, 8902, 197281])
+            self.assertEqual(len(board.move_stack), 0)
+
+    def test_divide(self):
+        """The parallel divide splits the nodes between the root moves."""
+        divide = Perft(1).divide(3, workers=2)
+        self.assertEqual(len(divide), 20)
+        self.assertEqual(divide["e2e4"], 600)
+        self.assertEqual(divide["g1f3"], 440)
+        self.assertEqual(sum(divide.values()), 8902)
+
+    def test_divide_mating_move(self):
+        """A root move that mates is listed with no nodes below it."""
+        fen = "6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1"
+        divide = Perft(0, fen).divide(3, workers=2)
+        self.assertEqual(len(divide), 20)
+        self.assertEqual(divide["a1a8"], 0)
+        self.assertEqual(sum(divide.values()), 3029)
+
+    def test_from_fen_perft(self):
+        """The suite positions load from FEN and count the right number of
+        nodes a couple of plies deep."""
+        for name, fen, counts in PERFT_SUITE:
+            perft = Perft(0, fen)
+            self.assertEqual(perft.perft(perft.game.board,
+                                         perft.game.current_turn, 2),
+                             counts[1], name)
+
+    def test_run_suite(self):
+        """The suite runner flags mismatches with a divide and writes its
+        results as JSON."""
+        positions = [PERFT_SUITE[2], ("wrong", PERFT_SUITE[2][1], [14, 190])]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "perft.json")
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                results = run_suite(2, 1, path, positions)
+            with open(path) as results_file:
+                written = json.load(results_file)
+        self.assertEqual([result["passed"] for result in results],
+                         [True, True, True, False])
+        self.assertEqual(written["results"], results)
+        self.assertIn("expected 190", output.getvalue())
+        self.assertIn("  b4b1: ", output.getvalue())
+
+    def test_run_suite_uncached(self):
+        """By default the suite times move generation, without a table."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "perft.json")
+            with contextlib.redirect_stdout(io.StringIO()):
+                run_suite(2, path=path, positions=PERFT_SUITE[:1])
+            with open(path) as results_file:
+                written = json.load(results_file)
+        self.assertEqual(written["megabytes"], 0)
+        self.assertEqual([result["nodes"] for result in written["results"]],
+                         [20, 400])
+
+
+class TestEvaluation(unittest.TestCase):
+    """Test suite for the evaluation."""
+
+    def test_incremental_scores(self):
+        """The running totals follow every kind of move and its unmaking,
+        and match the totals worked out from scratch."""
+        game = Game()
+        start = (0, 0, MAX_PHASE)
+        for name, fen, counts in PERFT_SUITE:
+            game.load_fen(fen)
+            board = game.board
+            before = compute_scores(board)
+            self.assertEqual((board.mg_score, board.eg_score, board.phase),
+                             before)
+            for move in board.generate_moves(board.turn):
+                board.make_move(move)
+                self.assertEqual((board.mg_score, board.eg_score,
+                                  board.phase), compute_scores(board))
+                board.unmake_move()
+            self.assertEqual((board.mg_score, board.eg_score, board.phase),
+                             before)
+        game.new_game()
+        self.assertEqual(compute_scores(game.board), start)
+
+    def test_evaluate(self):
+        """Scores are from the side to move's point of view, and the same
+        for mirrored positions."""
+        game = Game()
+        game.load_fen("4k3/8/8/8/8/8/4P3/4K3 w - - 0 1")
+        white_to_move = evaluate(game.board)
+        self.assertGreater(white_to_move, 100)
+        game.load_fen("4k3/4p3/8/8/8/8/8/4K3 b - - 0 1")
+        self.assertEqual(evaluate(game.board), white_to_move)
+        game.load_fen("4k3/8/8/8/8/8/4P3/4K3 b - - 0 1")
+        self.assertEqual(evaluate(game.board), -white_to_move)
+
+        # A pawn about to promote is worth more in the endgame.
+        game.load_fen("4k3/P7/8/8/8/8/8/4K3 w - - 0 1")
+        self.assertGreater(evaluate(game.board), white_to_move)
+
+
+class TestBitbases(unittest.TestCase):
+    """Test suite for the endgame bitbases. The tables are generated once
+    for the whole suite, which takes a few seconds."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_all(cls.directory.name)
+        cls.bitbases = Bitbases(cls.directory.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.bitbases.close()
+        cls.directory.cleanup()
+
+    def probe(self, fen):
+        """Probes the position of the FEN string."""
+        game = Game()
+        game.load_fen(fen)
+        return self.bitbases.probe(game.board)
+
+    def test_pawn_endings(self):
+        """King and pawn against king: the opposition, rook pawns and the
+        square of the pawn."""
+        # The king on the sixth in front of its pawn wins either way.
+        self.assertEqual(self.probe("4k3/8/4K3/4P3/8/8/8/8 w - - 0 1"), 1)
+        self.assertEqual(self.probe("4k3/8/4K3/4P3/8/8/8/8 b - - 0 1"), -1)
+        # Two squares in front, whoever has the opposition decides.
+        self.assertEqual(self.probe("4k3/8/8/4K3/4P3/8/8/8 w - - 0 1"), 1)
+        self.assertEqual(self.probe("4k3/8/8/4K3/4P3/8/8/8 b - - 0 1"), 0)
+        self.assertEqual(self.probe("k7/8/K7/P7/8/8/8/8 w - - 0 1"), 0)
+        # The black king is outside the square, then inside it.
+        self.assertEqual(self.probe("8/8/8/8/7k/8/P7/K7 w - - 0 1"), 1)
+        self.assertEqual(self.probe("8/8/8/8/6k1/8/P7/K7 b - - 0 1"), 0)
+        # The same with the colors swapped.
+        self.assertEqual(self.probe("8/8/8/4p3/4k3/8/8/4K3 b - - 0 1"), 1)
+        self.assertEqual(self.probe("8/8/8/4p3/4k3/8/8/4K3 w - - 0 1"), 0)
+
+    def test_piece_endings(self):
+        """A rook or queen wins unless it is lost at once or the weak side
+        is stalemated. A lone minor piece draws."""
+        self.assertEqual(self.probe("8/8/8/4k3/8/8/8/4K2R b - - 0 1"), -1)
+        self.assertEqual(self.probe("8/8/8/8/8/8/6k1/4K2R w - - 0 1"), 1)
+        self.assertEqual(self.probe("8/8/8/8/8/8/6k1/4K2R b - - 0 1"), 0)
+        self.assertEqual(self.probe("7k/8/6QK/8/8/8/8/8 b - - 0 1"), 0)
+        self.assertEqual(self.probe("7k/5Q2/6K1/8/8/8/8/8 w - - 0 1"), 1)
+        self.assertEqual(self.probe("8/8/3k4/8/8/8/8/4KN2 w - - 0 1"), 0)
+        self.assertEqual(self.probe("8/8/3k4/8/8/8/8/4K3 w - - 0 1"), 0)
+        self.assertTrue(
+            self.probe("8/8/3k4/8/8/8/4P3/4KN2 w - - 0 1") is None)
+
+    def test_missing_king(self):
+        """Boards without both kings are not covered."""
+        self.assertTrue(self.probe("8/8/8/8/8/8/4r3/R3K3 w - - 0 1") is None)
+        board, white, black = create_board_and_players()
+        board.add_to_board(King(white, [4, 7]))
+        board.add_to_board(Queen(white, [3, 7]))
+        self.assertTrue(self.bitbases.probe(board) is None)
+        board.remove_from_board([3, 7])
+        self.assertTrue(self.bitbases.probe(board) is None)
+
+    def test_adjudicate(self):
+        """Games are adjudicated from the bitbases."""
+        game = Game()
+        game.load_fen("8/8/8/4k3/8/8/8/4K2R b - - 0 1")
+        self.assertTrue(game.adjudicate(self.bitbases) is game.white)
+        game.load_fen("8/8/8/4p3/4k3/8/8/4K3 b - - 0 1")
+        self.assertTrue(game.adjudicate(self.bitbases) is game.black)
+        game.load_fen("k7/8/K7/P7/8/8/8/8 w - - 0 1")
+        self.assertTrue(game.adjudicate(self.bitbases) is True)
+        game.new_game()
+        self.assertTrue(game.adjudicate(self.bitbases) is None)
+
+    def test_search(self):
+        """The search scores a capture into a won ending as a known win,
+        and from a won ending only plays moves that keep the win."""
+        game = Game()
+        game.load_fen("4k3/8/8/8/8/8/3n4/3QK3 w - - 0 1")
+        result = Search(game.board, bitbases=self.bitbases).search(2)
+        self.assertTrue(KNOWN_WIN < result.score < MATE - 1000)
+        game.load_fen("4k3/8/8/4K3/4P3/8/8/8 w - - 0 1")
+        result = Search(game.board, bitbases=self.bitbases).search(3)
+        game.make_move(result.move)
+        self.assertEqual(self.bitbases.probe(game.board), -1)
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestFeatures(unittest.TestCase):
+    """Test suite for the batched feature planes."""
+
+    def test_piece_planes(self):
+        """The piece planes agree with the board square by square."""
+        game = Game()
+        game.load_fen(PERFT_SUITE[1][1])
+        planes = encode_boards([game.board])
+        self.assertEqual(planes.shape, (1, PLANES, 8, 8))
+        self.assertEqual(planes.dtype, numpy.float32)
+        for y_coord in range(8):
+            for x_coord in range(8):
+                piece = game.board.get_piece_at_position([x_coord, y_coord])
+                column = planes[0, :12, y_coord, x_coord]
+                if piece is None:
+                    self.assertEqual(column.sum(), 0)
+                else:
+                    self.assertEqual(column.sum(), 1)
+                    self.assertEqual(column[piece.color * 6 + piece.kind], 1)
+
+    def test_state_planes(self):
+        """Side to move, castling and en passant get their own planes."""
+        games = [Game(), Game()]
+        games[0].load_fen("rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR "
+                          "w Kq f6 0 3")
+        games[1].load_fen("4k3/8/8/8/3Pp3/8/8/4K3 b - d3 0 1")
+        planes = encode_boards([game.board for game in games],
+                               dtype=numpy.uint8)
+        self.assertEqual(planes.dtype, numpy.uint8)
+        self.assertEqual(planes[:, 12].sum(axis=(1, 2)).tolist(), [64, 0])
+        self.assertEqual(planes[0, 13:17].sum(axis=(1, 2)).tolist(),
+                         [64, 0, 0, 64])
+        self.assertEqual(planes[1, 13:17].sum(), 0)
+        # f6 and d3.
+        self.assertEqual(numpy.argwhere(planes[0, 17]).tolist(), [[2, 5]])
+        self.assertEqual(numpy.argwhere(planes[1, 17]).tolist(), [[5, 3]])
+
+    def test_snapshots(self):
+        """Snapshots encode the same as their boards, empty batches too."""
+        game = Game()
+        game.new_game()
+        self.assertTrue((encode_snapshots([game.board.snapshot()]) ==
+                         encode_boards([game.board])).all())
+        self.assertEqual(encode_snapshots([]).shape, (0, PLANES, 8, 8))
+
+
+class TestSelfPlay(unittest.TestCase):
+    """Test suite for the self-play batches."""
+
+    def test_playout_endings(self):
+        """Games that are already over end straight away."""
+        for fen, outcome in [
+                ("R5k1/5ppp/8/8/8/8/5PPP/6K1 b - - 0 1", "1-0"),
+                ("6k1/8/8/8/8/8/5PPP/r5K1 w - - 0 1", "0-1"),
+                ("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1", "1/2-1/2"),
+                ("8/8/3k4/8/8/8/8/4KN2 w - - 0 1", "1/2-1/2"),
+                ("8/8/3k4/8/8/8/8/4KR2 w - - 100 80", "1/2-1/2")]:
+            board = Board.from_fen(fen, Player(Color.W), Player(Color.B))
+            fields = fen.split()
+            result = playout(board, random.Random(0),
+                             halfmove_clock=int(fields[4]),
+                             fullmove_number=int(fields[5]))
+            self.assertEqual(result, Playout(outcome, 0, fen))
+
+    def test_policy(self):
+        """Moves come from the policy and the FEN counts the moves."""
+        def first_move(board, moves, rng):
+            return moves[0]
+        board = Board.from_fen("8/8/3k4/8/8/8/8/R3K3 b - - 0 1",
+                               Player(Color.W), Player(Color.B))
+        result = playout(board, random.Random(0), first_move, max_plies=5)
+        self.assertEqual(result.length, 5)
+        fields = result.fen.split()
+        self.assertEqual(fields[:4], board.to_fen().split()[:4])
+        self.assertEqual(fields[1], "w")
+        self.assertEqual(fields[5], "4")
+
+    def test_play_games(self):
+        """A batch plays out the same in this process and in the pool."""
+        games = list(play_games(6, seed=7, workers=1))
+        self.assertEqual(len(games), 6)
+        self.assertEqual(list(play_games(6, seed=7, workers=2,
+                                         chunk_size=4)), games)
+        self.assertNotEqual(list(play_games(6, seed=8, workers=1)), games)
+        for result in games:
+            self.assertTrue(result.outcome in ("1-0", "0-1", "1/2-1/2"))
+            self.assertTrue(0 < result.length <= 1000)
+            game = Game()
+            game.load_fen(result.fen)
+            self.assertEqual(game.to_fen(), result.fen)
+
+
+class TestOpeningBook(unittest.TestCase):
+    """Test suite for Polyglot keys and book lookups."""
+
+    def write_book(self, entries):
+        """Writes the (key, raw move, weight) entries, sorted, to a
+        temporary book file and returns its path."""
+        handle, path = tempfile.mkstemp(suffix=".bin")
+        with os.fdopen(handle, "wb") as book_file:
+            for key, raw_move, weight in sorted(entries):
+                book_file.write(ENTRY.pack(key, raw_move, weight, 0))
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_polyglot_key(self):
+        """Keys match the Polyglot format's own test positions."""
+        game = Game()
+        game.new_game()
+        self.assertEqual(polyglot_key(game.board), 0x463B96181691FC9C)
+        game.load_fen("rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR "
+                      "w KQkq f6 0 3")
+        self.assertEqual(polyglot_key(game.board), 0x22A48B5A8E47FF78)
+        game.load_fen("rnbq1bnr/ppp1pkpp/8/3pPp2/8/8/PPPPKPPP/RNBQ1BNR "
+                      "w - - 0 4")
+        self.assertEqual(polyglot_key(game.board), 0x00FDD303C946BDD9)
+
+    def test_polyglot_move(self):
+        """Moves are encoded from a1 up and castling takes the rook."""
+        game = Game()
+        game.load_fen("4k3/8/8/8/8/8/8/4K2R w K - 0 1")
+        moves = {move_name(move): polyglot_move(move)
+                 for move in game.board.generate_moves(0)}
+        # e1 is file 4 rank 0, h1 file 7 rank 0.
+        self.assertEqual(moves["e1g1"], 4 << 6 | 7)
+        self.assertEqual(moves["h1h8"], 7 << 6 | 7 << 3 | 7)
+
+    def test_book_moves(self):
+        """The book's moves for a position come back as packed moves and
+        are picked in proportion to their weights."""
+        game = Game()
+        game.new_game()
+        key = polyglot_key(game.board)
+        # From rank, from file, to rank, to file.
+        e2e4 = 1 << 9 | 4 << 6 | 3 << 3 | 4
+        d2d4 = 1 << 9 | 3 << 6 | 3 << 3 | 3
+        path = self.write_book([(key, e2e4, 3), (key, d2d4, 1),
+                                (key - 1, e2e4, 5), (key + 1, d2d4, 5)])
+        with OpeningBook(path) as book:
+            self.assertEqual(len(book), 4)
+            moves = {move_name(move): weight
+                     for move, weight in book.moves(game.board)}
+            self.assertEqual(moves, {"e2e4": 3, "d2d4": 1})
+            rng = random.Random(1)
+            picks = [move_name(book.choose(game.board, rng))
+                     for _ in range(400)]
+            self.assertTrue(200 < picks.count("e2e4") < 400)
+            move = game.make_book_move(book, rng)
+            self.assertTrue(move_name(move) in moves)
+            self.assertTrue(game.current_turn is game.black)
+            # Out of book after the move.
+            self.assertTrue(game.make_book_move(book, rng) is None)
+
+    def test_empty_book(self):
+        """An empty book has no moves."""
+        game = Game()
+        game.new_game()
+        with OpeningBook(self.write_book([])) as book:
+            self.assertEqual(len(book), 0)
+            self.assertTrue(game.make_book_move(book) is None)
+
+
+class TestSearch(unittest.TestCase):
+    """Test suite for the alpha beta search."""
+
+    def test_mate_in_one(self):
+        """The back rank mate is found, scored as a mate in one ply and the
+        board is left as it was."""
+        game = Game()
+        game.load_fen("6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1")
+        fen = game.to_fen()
+        result = Search(game.board).search(4)
+        self.assertEqual(move_name(result.move), "a1a8")
+        self.assertEqual(result.score, MATE - 1)
+        self.assertEqual(result.pv, [result.move])
+        self.assertEqual(game.to_fen(), fen)
+
+    def test_wins_material(self):
+        """The hanging queen is taken, and the principal variation starts
+        with the best move."""
+        game = Game()
+        game.load_fen("4k3/8/8/3q4/8/8/3R4/4K3 w - - 0 1")
+        result = Search(game.board).search(3)
+        self.assertEqual(move_name(result.move), "d2d5")
+        self.assertEqual(result.pv[0], result.move)
+        self.assertEqual(result.depth, 3)
+        self.assertGreater(result.score, 400)
+
+    def test_node_budget(self):
+        """A node budget stops the search early, keeping the last finished
+        iteration and unwinding the board."""
+        game = Game()
+        game.new_game()
+        result = Search(game.board).search(20, nodes=2000)
+        self.assertLess(result.depth, 20)
+        self.assertLessEqual(result.nodes, 2001)
+        self.assertTrue(result.move in game.board.generate_moves(0))
+        self.assertEqual(len(game.board.move_stack), 0)
+        self.assertEqual(game.board.hash, game.board.compute_hash())
+
+    def test_move_ordering(self):
+        """The hash move comes first, then captures of the most valuable
+        victim by the least valuable attacker, then killers."""
+        game = Game()
+        game.load_fen("4k3/8/2q1r3/3P4/8/8/2Q5/6K1 w - - 0 1")
+        board = game.board
+        search = Search(board)
+        moves = board.generate_moves(board.turn)
+        quiet = [move for move in moves if not move & CAPTURE]
+        search.killers[0][0] = quiet[3]
+        ordered = search.order_moves(moves, 0, quiet[5])
+        self.assertEqual(sorted(ordered), sorted(moves))
+        self.assertEqual([move_name(move) for move in ordered[:5]],
+                         [move_name(quiet[5]), "d5c6", "c2c6",
+                          "d5e6", move_name(quiet[3])])
+
+    def test_cutoff_counters(self):
+        """Cutoffs are counted, and most come from the first move."""
+        game = Game()
+        game.new_game()
+        search = Search(game.board)
+        search.search(4)
+        self.assertGreater(search.cutoffs, 0)
+        self.assertGreater(search.cutoff_rate, 0.5)
+        self.assertLessEqual(search.cutoff_rate, 1)
+
+    def test_see(self):
+        """Exchanges are worked out with x-rays and the option to stop
+        taking back."""
+        game = Game()
+        for fen, name, gain in (
+                ("1k1r4/1pp4p/p7/4p3/8/P5P1/1PP4P/2K1R3 w - - 0 1",
+                 "e1e5", 100),
+                ("1k1r3q/1ppn3p/p4b2/4p3/8/P2N2P1/1PP1R1BP/2K1Q3 w - - 0 1",
+                 "d3e5", -220),
+                ("4k3/8/2p5/3p4/4P3/8/8/4K3 w - - 0 1", "e4d5", 0),
+                ("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1", "e5d6", 100)):
+            game.load_fen(fen)
+            moves = [move for move in game.board.generate_moves(0)
+                     if move_name(move) == name]
+            self.assertEqual(see(game.board, moves[0]), gain, fen)
+
+    def test_quiescence(self):
+        """A one ply search sees the pawn taking back, so the queen does
+        not take the defended pawn."""
+        game = Game()
+        game.load_fen("4k3/8/4p3/3p4/8/8/8/3QK3 w - - 0 1")
+        result = Search(game.board).search(1)
+        self.assertNotEqual(move_name(result.move), "d1d5")
+        self.assertGreater(result.score, 600)
+
+    def test_quiescence_in_check(self):
+        """In check, quiescence searches the evasions instead of standing
+        pat and sees mate, so a one ply search finds the back rank mate."""
+        game = Game()
+        game.load_fen("R5k1/5ppp/8/8/8/8/5PPP/6K1 b - - 0 1")
+        search = Search(game.board)
+        self.assertEqual(search.quiesce(-INFINITY, INFINITY, 0), -MATE)
+        game.load_fen("6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1")
+        result = Search(game.board).search(1)
+        self.assertEqual(move_name(result.move), "a1a8")
+        self.assertEqual(result.score, MATE - 1)
+
+    def test_movetime(self):
+        """A movetime search stops in time, with a move from a finished
+        iteration and the board unwound."""
+        game = Game()
+        game.new_game()
+        start = time.monotonic()
+        result = Search(game.board).search(movetime=0.2)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertGreaterEqual(result.depth, 1)
+        self.assertTrue(result.move in game.board.generate_moves(0))
+        self.assertEqual(len(game.board.move_stack), 0)
+
+    def test_clock(self):
+        """A move gets a share of the clock plus most of the increment,
+        and a small clock keeps the search short."""
+        search = Search(Board())
+        target, most = search.allot_time(60, 1)
+        self.assertAlmostEqual(target, 2.75)
+        self.assertAlmostEqual(most, 11)
+        target, most = search.allot_time(0.4, 0)
+        self.assertLessEqual(most, 0.1)
+
+        # A loaded machine may be slow to stop, so the time allowed is
+        # generous; the depth shows the clock cut the search short.
+        game = Game()
+        game.new_game()
+        start = time.monotonic()
+        result = Search(game.board).search(clock=0.4)
+        self.assertLess(time.monotonic() - start, 2)
+        unlimited = Search(game.board).search(depth=5)
+        self.assertLess(result.depth, unlimited.depth)
+
+    def test_stop_flag(self):
+        """Setting the stop flag from another thread ends the search."""
+        game = Game()
+        game.new_game()
+        stop = threading.Event()
+        timer = threading.Timer(0.1, stop.set)
+        timer.start()
+        start = time.monotonic()
+        result = Search(game.board).search(stop=stop)
+        timer.join()
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertTrue(result.move in game.board.generate_moves(0))
+        self.assertEqual(len(game.board.move_stack), 0)
+
+    def test_no_moves(self):
+        """Stalemate has no best move and scores as a draw."""
+        game = Game()
+        game.load_fen("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1")
+        result = Search(game.board).search(3)
+        self.assertTrue(result.move is None)
+        self.assertEqual(result.score, 0)
+
+    def test_parallel_search(self):
+        """Workers sharing a table find the mate and leave the board as it
+        was."""
+        game = Game()
+        game.load_fen("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1")
+        fen = game.to_fen()
+        result = parallel_search(game.board, workers=2, megabytes=1,
+                                 depth=3)
+        self.assertEqual(move_name(result.move), "d1d8")
+        self.assertEqual(result.score, MATE - 1)
+        self.assertTrue(result.nodes > 0)
+        self.assertEqual(game.to_fen(), fen)
+
+    def test_search_worker_error(self):
+        """A failing worker raises its own error, not one from closing the
+        shared memory under the table."""
+        game = Game()
+        game.new_game()
+        table_memory = SharedMemory(create=True, size=1 << 16)
+        flag_memory = SharedMemory(create=True, size=1)
+        try:
+            with self.assertRaises(TypeError):
+                _search_worker(game.board.snapshot(), table_memory.name,
+                               flag_memory.name, 0, {"plies": 3})
+        finally:
+            for memory in (table_memory, flag_memory):
+                memory.close()
+                memory.unlink()
+
+
 if __name__ == '__main__':
     unittest.main()
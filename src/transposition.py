@@ -0,0 +1,120 @@
+"""Fixed size transposition table, keyed by the board's Zobrist hash.
+
+The table is one flat buffer of unsigned 64 bit words, so its memory is
+set once when it is made and never grows. Entries take two words: the
+key XORed with the packed data, then the data itself. A probe only
+accepts an entry whose words XOR back to the key, so a torn entry (half
+written by another process sharing the buffer) reads as a miss.
+
+Entries sit in buckets of two. The first slot is depth preferred and only
+gives way to deeper searches (or entries from an older search), the
+second is always replaced."""
+
+# ------------ Constants -------------
+
+# Bound types, what the stored score means.
+EXACT, LOWER, UPPER = 1, 2, 3
+
+# Packed entry data:
+#   bits 0-18   best move (a packed move, 0 if none)
+#   bits 19-26  depth
+#   bits 27-28  bound, 0 for an empty slot
+#   bits 29-44  score, offset to be unsigned
+#   bits 45-52  generation, the search the entry was stored in
+MOVE_MASK = (1 << 19) - 1
+MAX_DEPTH = 255
+SCORE_OFFSET = 1 << 15
+
+ENTRY_BYTES = 16
+BUCKET_ENTRIES = 2
+
+
+class TranspositionTable:
+    """A transposition table using about megabytes of memory, or the
+    memory of buffer (such as a multiprocessing.shared_memory buffer) if
+    one is given, so several processes can share one table. The number of
+    buckets is rounded down to a power of two."""
+    def __init__(self, megabytes=16, buffer=None):
+        if buffer is None:
+            size = megabytes * (1 << 20)
+        else:
+            size = len(buffer)
+        buckets = max(1, size // (ENTRY_BYTES * BUCKET_ENTRIES))
+        self.buckets = 1 << (buckets.bit_length() - 1)
+        size = self.buckets * BUCKET_ENTRIES * ENTRY_BYTES
+        if buffer is None:
+            buffer = bytearray(size)
+        self.table = memoryview(buffer)[:size].cast("Q")
+        self.generation = 0
+
+    def release(self):
+        """Lets go of the buffer, which a shared memory block needs before
+        it can be closed. The table cannot be used afterwards."""
+        self.table.release()
+
+    def __len__(self):
+        """The number of entries the table can hold."""
+        return self.buckets * BUCKET_ENTRIES
+
+    def clear(self):
+        """Empties the table."""
+        self.table[:] = memoryview(bytes(self.table.nbytes)).cast("Q")
+        self.generation = 0
+
+    def new_search(self):
+        """Starts a new search. Entries from older searches are replaced
+        first and no longer count towards hashfull."""
+        self.generation = (self.generation + 1) & 255
+
+    def probe(self, key):
+        """Returns (move, depth, bound, score) stored for the key, or
+        None if the key is not in the table."""
+        table = self.table
+        index = (key & (self.buckets - 1)) * 4
+        for slot in (index, index + 2):
+            data = table[slot + 1]
+            if data and table[slot] ^ data == key:
+                return (data & MOVE_MASK, data >> 19 & 255, data >> 27 & 3,
+                        (data >> 29 & 0xFFFF) - SCORE_OFFSET)
+        return None
+
+    def store(self, key, move, depth, bound, score):
+        """Stores a search result. Storing without a move keeps the move
+        already held for the key."""
+        table = self.table
+        index = (key & (self.buckets - 1)) * 4
+        # Same key in either slot, overwrite it in place.
+        slot = None
+        for candidate in (index, index + 2):
+            old = table[candidate + 1]
+            if old and table[candidate] ^ old == key:
+                slot = candidate
+                if not move:
+                    move = old & MOVE_MASK
+                break
+        if slot is None:
+            old = table[index + 1]
+            if (not old or depth >= (old >> 19 & 255) or
+                    old >> 45 != self.generation):
+                slot = index
+            else:
+                slot = index + 2
+        data = ((move & MOVE_MASK) | min(depth, MAX_DEPTH) << 19 |
+                bound << 27 |
+                (max(-SCORE_OFFSET, min(SCORE_OFFSET - 1, score)) +
+                 SCORE_OFFSET) << 29 |
+                self.generation << 45)
+        table[slot] = key ^ data
+        table[slot + 1] = data
+
+    def hashfull(self):
+        """Returns how full the table is in permille, counting the entries
+        of the current search among the first thousand or so."""
+        table = self.table
+        sample = min(len(self), 1000)
+        used = 0
+        for slot in range(0, sample * 2, 2):
+            data = table[slot + 1]
+            if data and data >> 45 == self.generation:
+                used += 1
+        return used * 1000 // sample
@@ -0,0 +1,30 @@
+"""Zobrist keys used to hash positions. A position's hash is the XOR of
+the key of every piece on its square, the side to move key when black is
+to move, the castling rights key and the en passant file key. Keys come
+from a fixed seed so hashes are the same from run to run."""
+# stdlib imports
+import random
+
+_RANDOM = random.Random(0x5A0B1257)
+
+
+def _key():
+    """Returns a random 64 bit key."""
+    return _RANDOM.getrandbits(64)
+
+
+# PIECE_KEYS[color][kind][square]
+PIECE_KEYS = [[[_key() for square in range(64)] for kind in range(6)]
+              for color in range(2)]
+SIDE_KEY = _key()
+EN_PASSANT_KEYS = [_key() for x_coord in range(8)]
+
+# One key per castling right, bits as in Board.castling_rights. The table
+# is indexed by the rights themselves and holds the XOR of the keys of
+# each right held, so CASTLING_KEYS[old ^ new] swaps old rights for new.
+_CASTLING_RIGHT_KEYS = [_key() for right in range(4)]
+CASTLING_KEYS = [0] * 16
+for _rights in range(16):
+    for _right in range(4):
+        if _rights >> _right & 1:
+            CASTLING_KEYS[_rights] ^= _CASTLING_RIGHT_KEYS[_right]